@@ -0,0 +1,170 @@
+"""
+Call a function for each row of a set of columns.
+
+:func:`batch_call` and :func:`batch_iter` bind the columns to the
+parameters of the function once and then call it from a generated loop.
+Wrappers created by ``partial``, ``wraps``, ``decorator`` and
+``flatorator`` are bypassed, i.e. each row costs a single call of the
+original function (or of the callback of the wrapper):
+
+>>> from black_magic.decorator import partial
+>>> def scale(x, factor, offset=0):
+...     return x * factor + offset
+>>> batch_call(partial(scale, factor=2), [1, 2, 3], offset=[0, 10, 20])
+[2, 14, 26]
+
+Columns can be arbitrary iterables. Like ``zip``, iteration stops with the
+shortest column.
+"""
+
+from __future__ import absolute_import
+
+
+__all__ = [
+    'batch_call',
+    'batch_iter',
+]
+
+
+import types
+
+from . import compat
+from .decorator import (ASTorator, _ParameterBinding, _partial_target,
+                        _forward_target, _layout_call, _nested_code,
+                        _globals, _new_cell)
+
+
+def batch_call(func, *columns, **kwcolumns):
+    """
+    Return the list of results of ``func`` for all rows.
+
+    The i-th row consists of the i-th items of the positional and keyword
+    ``columns``. Columns are bound to the parameters in the same way as
+    the arguments of :func:`black_magic.decorator.partial`, i.e. keyword
+    columns first.
+    """
+    return _batch(func, columns, kwcolumns, False)
+
+
+def batch_iter(func, *columns, **kwcolumns):
+    """
+    Return an iterator over the results of ``func`` for all rows.
+
+    Same as :func:`batch_call`, except that the results are computed on
+    demand.
+    """
+    return _batch(func, columns, kwcolumns, True)
+
+
+class _Column(object):
+
+    """Placeholder for the values of a column in a parameter binding."""
+
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+
+def _batch(func, columns, kwcolumns, stream):
+    if not columns and not kwcolumns:
+        raise TypeError("At least one column is required.")
+    names = list(kwcolumns)
+    values = list(columns) + [kwcolumns[name] for name in names]
+    markers = [_Column(index) for index in range(len(values))]
+
+    # bind the columns to the parameters of the original function:
+    target = _partial_target(func)
+    prefix = ()
+    if target is None:
+        binding = _ParameterBinding.from_signature(
+            ASTorator.signature_cache(func))
+        forward = _forward_target(func)
+        if forward is not None:
+            func, prefix = forward
+    else:
+        func, binding = target
+    binding = binding.bind(*markers[:len(columns)],
+                           **dict(zip(names, markers[len(columns):])))
+    layout, consts = _batch_layout(binding, prefix)
+
+    # positional columns only, the builtin map is the fastest loop:
+    if layout == (tuple(range(len(values))), ()):
+        results = map(func, *values)
+        return results if stream else list(results)
+
+    key = ('batch', layout, len(values), stream)
+    code = ASTorator._cached(ASTorator.code_cache, key, _compile_batch,
+                             layout, len(values), stream)
+    namespace = {'_call': func, '_zip': zip}
+    namespace.update(('_bm_c%d' % i, value) for i, value in enumerate(consts))
+    loop = types.FunctionType(code, _globals, code.co_name, None, tuple(
+        _new_cell(namespace[name]) for name in code.co_freevars))
+    return loop(*values)
+
+
+def _batch_layout(binding, prefix):
+    """
+    Return the call layout and constants for a binding of columns.
+
+    Column placeholders become the indices of the columns, all other
+    values (including the defaults of unbound parameters) are constants.
+    """
+    consts = list(prefix)
+    def item(value):
+        if isinstance(value, _Column):
+            return value.index
+        consts.append(value)
+        return None
+
+    empty = compat.Parameter.empty
+    args = [None] * len(prefix)
+    for index, value in enumerate(binding.args):
+        if not binding.is_bound(index) and value is empty:
+            raise TypeError("No column for parameter '%s'."
+                            % binding._parameters[index].name)
+        args.append(item(value))
+    for param in binding.free_parameters:
+        if (param.kind == param.KEYWORD_ONLY and
+                param.name not in binding.kwargs):
+            raise TypeError("No column for parameter '%s'." % param.name)
+    keywords = [(key, item(value)) for key, value in binding.kwargs.items()]
+    return (tuple(args), tuple(keywords)), consts
+
+
+def _compile_batch(layout, num_columns, stream):
+    """
+    Compile the loop that calls ``_call`` for each row of the columns.
+
+    The loop is a function of the columns. The callback, ``zip`` and the
+    constant slots are free variables.
+    """
+    import ast
+    rows = ['_bm_%d' % i for i in range(num_columns)]
+    columns = ['_bm_col%d' % i for i in range(num_columns)]
+    num_consts = sum(item is None for item in layout[0]) + sum(
+        item is None for keyword, item in layout[1])
+    free = ['_call', '_zip'] + ['_bm_c%d' % i for i in range(num_consts)]
+    if num_columns == 1:
+        loop = 'for %s in %s' % (rows[0], columns[0])
+    else:
+        loop = 'for (%s) in _zip(%s)' % (', '.join(rows), ', '.join(columns))
+    if stream:
+        body = "        %s:\n            yield _bm_call\n" % loop
+    else:
+        body = "        return [_bm_call %s]\n" % loop
+    module = ast.parse(
+        "def _bm_outer(%s):\n"
+        "    def _bm_batch(%s):\n"
+        "%s"
+        "    return _bm_batch\n" % (', '.join(free), ', '.join(columns), body))
+    call = _layout_call(
+        ast.Name(id='_call', ctx=ast.Load(), lineno=1, col_offset=0),
+        layout, rows)
+    statement = module.body[0].body[0].body[0]
+    if stream:
+        statement.body[0].value.value = call
+    else:
+        statement.value.elt = call
+    module = ast.fix_missing_locations(module)
+    return _nested_code(compile(module, '<batch>', 'exec'))
@@ -0,0 +1,173 @@
+"""
+Decorate all functions of a class or module at once.
+
+:func:`decorate_class` and :func:`decorate_module` apply a decorator to
+many functions in one go. For decorators created by ``decorator`` or
+``flatorator`` the functions are grouped by the shape of their parameters
+(names and kinds): the signature is computed and the wrapper code is
+generated only once per shape, further wrappers of the same shape copy it
+with their own name, defaults and annotations:
+
+>>> from black_magic.decorator import flatorator
+>>> @flatorator
+... def negate(fn, *args, **kwargs):
+...     return -fn(*args, **kwargs)
+>>> class Numbers(object):
+...     def one(self, x=1):
+...         return x
+...     @staticmethod
+...     def two():
+...         return 2
+...     @classmethod
+...     def three(cls):
+...         return 3
+...     @property
+...     def four(self):
+...         return 4
+>>> Numbers = decorate_class(Numbers, negate)
+>>> numbers = Numbers()
+>>> numbers.one(), numbers.two(), Numbers.three(), numbers.four
+(-1, -2, -3, -4)
+
+Other decorators are simply applied to each function.
+"""
+
+from __future__ import absolute_import
+
+
+__all__ = [
+    'decorate_class',
+    'decorate_module',
+]
+
+
+import types
+
+from .decorator import (ASTorator, Value, _decorator_target, _code_shape,
+                        _shape_decorator, _relabel, _is_ast_expr)
+
+
+def decorate_class(cls, deco, predicate=None):
+    """
+    Replace the methods of ``cls`` by ``deco(method)`` and return ``cls``.
+
+    Plain functions, static methods, class methods and the accessors of
+    properties that are defined in the class itself are decorated. If
+    ``predicate`` is given, only functions for which
+    ``predicate(name, function)`` is true are decorated, where ``name``
+    is the name of the attribute.
+    """
+    def functions(attr):
+        if isinstance(attr, (staticmethod, classmethod)):
+            return [attr.__func__]
+        if isinstance(attr, property):
+            return [attr.fget, attr.fset, attr.fdel]
+        return [attr]
+
+    attrs = [(name, attr) for name, attr in list(vars(cls).items())
+             if isinstance(attr, (types.FunctionType, staticmethod,
+                                  classmethod, property))]
+    wrappers = _decorate_all(
+        [(name, func) for name, attr in attrs for func in functions(attr)],
+        deco, predicate)
+
+    for name, attr in attrs:
+        if isinstance(attr, types.FunctionType):
+            new = wrappers.get(id(attr), attr)
+        elif isinstance(attr, (staticmethod, classmethod)):
+            func = wrappers.get(id(attr.__func__))
+            new = attr if func is None else type(attr)(func)
+        else:
+            new = attr
+            for accessor in ('getter', 'setter', 'deleter'):
+                func = wrappers.get(id(getattr(attr, _ACCESSORS[accessor])))
+                if func is not None:
+                    new = getattr(new, accessor)(func)
+        if new is not attr:
+            setattr(cls, name, new)
+    return cls
+
+
+def decorate_module(module, deco, predicate=None):
+    """
+    Replace the functions of ``module`` by ``deco(function)`` and return
+    ``module``.
+
+    Only functions that are defined in the module are decorated, i.e.
+    imported functions and the methods of classes are left alone (use
+    :func:`decorate_class` for the latter). ``predicate`` is used as for
+    :func:`decorate_class`.
+    """
+    modname = module.__name__
+    functions = [(name, func) for name, func in list(vars(module).items())
+                 if isinstance(func, types.FunctionType) and
+                 func.__module__ == modname]
+    wrappers = _decorate_all(functions, deco, predicate)
+    for name, func in functions:
+        if id(func) in wrappers:
+            setattr(module, name, wrappers[id(func)])
+    return module
+
+
+_ACCESSORS = {'getter': 'fget', 'setter': 'fset', 'deleter': 'fdel'}
+
+
+def _decorate_all(functions, deco, predicate=None):
+    """
+    Decorate the functions in the ``(name, function)`` pairs.
+
+    Returns a dict that maps the ``id`` of each decorated function to its
+    wrapper. Functions that occur multiple times are decorated once.
+    """
+    make = _decorator_target(deco)
+    plans = {}
+    wrappers = {}
+    for name, func in functions:
+        if (not isinstance(func, types.FunctionType) or id(func) in wrappers
+                or predicate is not None and not predicate(name, func)):
+            continue
+        shape = _code_shape(func) if make is not None else None
+        if shape is not None and shape not in plans:
+            plans[shape] = _shape_plan(func, shape)
+        plan = plans.get(shape)
+        if plan is None:
+            wrappers[id(func)] = deco(func)
+        else:
+            wrappers[id(func)] = _decorate_from_plan(func, plan, make)
+    return wrappers
+
+
+def _shape_plan(func, shape):
+    """
+    Return the plan to decorate functions of the given shape.
+
+    The plan consists of the attributes of the ``ASTorator`` that only
+    depend on the shape, and the name and filename under which the code
+    of the wrappers is cached.
+    """
+    decorator = ASTorator.from_function(func)
+    if decorator._kinds is None:
+        return None
+    names, argcount = shape[:2]
+    state = dict((attr, getattr(decorator, attr))
+                 for attr in ('_kinds', '_call_layout', '_varnames'))
+    return (tuple(range(argcount)), names, state,
+            decorator.funcname, decorator._filename)
+
+
+def _decorate_from_plan(func, plan, make):
+    """Create the wrapper of ``func`` from a plan, see :func:`_shape_plan`."""
+    positions, names, state, funcname, filename = plan
+    callback, args = make(func)
+    # custom expressions need the AST backend, i.e. the signature:
+    if _is_ast_expr(callback) or (isinstance(callback, Value) and
+                                  type(callback).ast is not Value.ast):
+        return ASTorator.from_function(func).decorate(callback)
+
+    decorator = _shape_decorator(func, state, positions, names)
+    own = (decorator.funcname, decorator._filename)
+    decorator.funcname, decorator._filename = funcname, filename
+    wrapper = decorator._update(decorator._create(callback, args))
+    if own != (funcname, filename):
+        _relabel(wrapper, own[0] or '<lambda>', own[1])
+    return wrapper
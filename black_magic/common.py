@@ -1,4 +1,36 @@
 
+import sys
+import types
+import operator
+
+# avoid importing threading and collections, they are not needed:
+from _thread import allocate_lock as Lock
+
+if sys.version_info >= (3, 7):
+    OrderedDict = dict
+else:
+    from collections import OrderedDict
+
+
+class CacheInfo(tuple):
+
+    """Cache statistics ``(hits, misses, maxsize, currsize)``."""
+
+    __slots__ = ()
+
+    hits = property(operator.itemgetter(0))
+    misses = property(operator.itemgetter(1))
+    maxsize = property(operator.itemgetter(2))
+    currsize = property(operator.itemgetter(3))
+
+    def __new__(cls, hits, misses, maxsize, currsize):
+        return tuple.__new__(cls, (hits, misses, maxsize, currsize))
+
+    def __repr__(self):
+        return 'CacheInfo(hits=%r, misses=%r, maxsize=%r, currsize=%r)' % (
+            self)
+
+
 def param_names(argspec):
     """
     Iterate over all parameter names used in the argspec.
@@ -30,3 +62,184 @@ class Scope:
             name += '_'
         self.names.add(name)
         return name
+
+
+class LRUCache(object):
+
+    """
+    Bounded mapping that discards the least recently used items first.
+
+    Counts hits and misses of :meth:`get` in the same manner as
+    ``functools.lru_cache``. All operations are thread-safe.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Lookup ``key`` and mark it as most recently used."""
+        with self._lock:
+            return self._get(key, default)
+
+    def _get(self, key, default):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        data = self._data
+        data.pop(key, None)
+        data[key] = value
+        while len(data) > self.maxsize:
+            del data[next(iter(data))]
+
+    def get_or_create(self, key, create):
+        """
+        Lookup ``key`` or store and return the result of ``create()``.
+
+        Only one thread at a time creates the value for a given key. Other
+        threads asking for the same key wait for it instead of creating the
+        value again. Values for different keys are created concurrently.
+        """
+        while True:
+            with self._lock:
+                value = self._get(key, None)
+                if value is not None:
+                    return value
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = Lock()
+                    pending.acquire()
+                    break
+            # wait for the other thread, then look again (it may have failed
+            # or the value may have been evicted in the meantime):
+            with pending:
+                pass
+            with self._lock:
+                value = self._data.get(key)
+                if value is not None:
+                    return value
+        try:
+            value = create()
+            with self._lock:
+                self._set(key, value)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.release()
+        return value
+
+    def clear(self):
+        """Remove all items and reset the statistics."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Return a :class:`CacheInfo` with the current statistics."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self))
+
+
+class SignatureCache(object):
+
+    """
+    Cache for the signatures of python functions.
+
+    Entries are weakly keyed by the function and are invalidated when its
+    ``__code__``, ``__defaults__``, ``__kwdefaults__``, ``__annotations__``,
+    ``__signature__`` or ``__wrapped__`` change. Other callables are not
+    cached. Statistics are available via :meth:`info`. All operations are
+    thread-safe, the signatures are computed outside of the lock.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._data = None
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data or ())
+
+    def __call__(self, function):
+        """Return the signature of ``function``."""
+        from . import compat
+        if type(function) is not types.FunctionType:
+            with self._lock:
+                self.misses += 1
+            return compat.signature(function)
+        extra = function.__dict__
+        with self._lock:
+            if self._data is None:
+                import weakref
+                self._data = weakref.WeakKeyDictionary()
+            entry = self._data.get(function)
+            if (entry is not None and
+                    entry[1] is function.__code__ and
+                    entry[2] is function.__defaults__ and
+                    _same_items(entry[3], function.__kwdefaults__) and
+                    _same_items(entry[4], function.__annotations__) and
+                    entry[5] is extra.get('__signature__') and
+                    entry[6] is extra.get('__wrapped__')):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        signature = compat.signature(function)
+        entry = (
+            signature,
+            function.__code__,
+            function.__defaults__,
+            _copy(function.__kwdefaults__),
+            _copy(function.__annotations__),
+            extra.get('__signature__'),
+            extra.get('__wrapped__'))
+        with self._lock:
+            self._data[function] = entry
+        return signature
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            if self._data is not None:
+                self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Return a :class:`CacheInfo` with the current statistics."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, None, len(self))
+
+
+def _copy(mapping):
+    return None if mapping is None else dict(mapping)
+
+
+def _same_items(a, b):
+    """Check that two mappings contain the identical items."""
+    if a is None or b is None:
+        return a is b
+    return len(a) == len(b) and all(
+        k in b and b[k] is v for k, v in a.items())
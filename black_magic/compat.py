@@ -1,9 +1,9 @@
 # encoding: utf-8
 """
-Compatibility wrappers for python2.
+Compatibility wrappers for different python3 versions.
 
-Provides replacements for python3 functions for a consistent interface on
-both languages.
+Provides a consistent interface to the ``ast``, ``inspect`` and code object
+APIs that changed between the supported python versions.
 """
 
 
@@ -11,123 +11,138 @@ __all__ = [
     'signature', 'Signature',
     'getfullargspec', 'FullArgSpec',
     'ast_arg',
+    'ast_arguments',
+    'ast_module',
+    'code_replace',
+    'code_relabel',
+    'new_cell',
+    'cell_contents_writable',
     'ast_set_special_arg',
-    'exec_compat',
-    'is_identifier',
+    'functools_partial',
 ]
 
 
 import sys
-import ast
+import types
 
 
-# Python2 has no annotations and kwonly arguments, therefore we need to
-# create a version of getargspec that returns dummy variables
-try:
+# The inspect module (and the ast module imported by it) take a noticable
+# time to import. They are loaded only when one of the following names is
+# accessed for the first time (python3.7 supports module __getattr__):
+_inspect_names = (
+    'getfullargspec', 'FullArgSpec',
+    'signature', 'Signature', 'Parameter', 'BoundArguments',
+)
+
+
+def _import_inspect():
     from inspect import getfullargspec, FullArgSpec
-except ImportError:
-    from inspect import getargspec
-    from collections import namedtuple
-    FullArgSpec = namedtuple(
-            'FullArgSpec', [
-                'args', 'varargs',
-                'varkw', 'defaults',
-                'kwonlyargs', 'kwonlydefaults',
-                'annotations'])
-    def getfullargspec(fn):
-        spec = getargspec(fn)
-        return FullArgSpec(
-            args=spec.args, varargs=spec.varargs,
-            varkw=spec.keywords, defaults=spec.defaults,
-            kwonlyargs=[], kwonlydefaults=None,
-            annotations={})
-
-
-# Python3 introduces the new inspect.Signature type which is much easier to
-# work with than FullArgSpec.
-try:
     from inspect import signature, Signature, Parameter, BoundArguments
-except ImportError:
-    from funcsigs import signature, Signature, Parameter, BoundArguments
+    namespace = locals()
+    globals().update((name, namespace[name]) for name in _inspect_names)
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name in _inspect_names:
+            _import_inspect()
+            return globals()[name]
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+else:
+    _import_inspect()
 
 
-# Python3 ast.arg does not exist in python2 as it has no annotations and
-# therefore no need for this extra type. So let's create a simple
-# replacement:
+# The functools module imports collections and more, but we only need the
+# partial type which is implemented in _functools on CPython:
 try:
-    from ast import arg as ast_arg
+    from _functools import partial as functools_partial
 except ImportError:
-    def ast_arg(arg, annotation, **kwargs):
-        return ast.Name(id=arg, ctx=ast.Param(), **kwargs)
+    from functools import partial as functools_partial
 
 
-# Python3.4 uses an ast.arg for ast.arguments.kwarg(annotation).
-if sys.version_info >= (3, 4):
-    def ast_set_special_arg(kind, arguments, name, annotation):
-        setattr(arguments, kind,
-                ast_arg(arg=name, annotation=annotation,
-                        lineno=1, col_offset=0))
-else:
-    def ast_set_special_arg(kind, arguments, name, annotation):
-        setattr(arguments, kind, name)
-        setattr(arguments, kind + 'annotation', annotation)
+def ast_arg(**kwargs):
+    import ast
+    return ast.arg(**kwargs)
 
 
-if sys.version_info >= (3, 5):
-    def ast_call_unpack_stararg(call, name):
-        call.args.append(ast.Starred(value=name, ctx=ast.Load(),
-                                     lineno=1, col_offset=0))
+def ast_set_special_arg(kind, arguments, name, annotation):
+    setattr(arguments, kind,
+            ast_arg(arg=name, annotation=annotation,
+                    lineno=1, col_offset=0))
 
-    def ast_call_unpack_kwarg(call, name):
-        call.keywords.append(ast.keyword(arg=None, value=name,
-                                         lineno=1, col_offset=0))
 
+# Python3.8 adds the required fields ast.arguments.posonlyargs and
+# ast.Module.type_ignores:
+if sys.version_info >= (3, 8):
+    def ast_arguments(**kwargs):
+        import ast
+        return ast.arguments(posonlyargs=[], **kwargs)
 
-else:
-    def ast_call_unpack_stararg(call, name):
-        call.starargs = name
+    def ast_module(body):
+        import ast
+        return ast.Module(body=body, type_ignores=[])
 
-    def ast_call_unpack_kwarg(call, name):
-        call.kwargs = name
+else:
+    def ast_arguments(**kwargs):
+        import ast
+        return ast.arguments(**kwargs)
 
+    def ast_module(body):
+        import ast
+        return ast.Module(body=body)
 
 
-def exec_compat(expression, globals, locals=None):
-    """
-    Compatibility exec function for python2 and python3.
+def ast_call_unpack_stararg(call, name):
+    import ast
+    call.args.append(ast.Starred(value=name, ctx=ast.Load(),
+                                 lineno=1, col_offset=0))
 
-    The python2 exec() statement is bound to the following restriction:
 
-        If exec is used in a function and the function contains a nested
-        block with free variables, the compiler will raise a SyntaxError
-        unless the exec explicitly specifies the local namespace for the
-        exec. (In  other words, "exec  obj" would be illegal,  but "exec
-        obj in ns" would be legal.)
+def ast_call_unpack_kwarg(call, name):
+    import ast
+    call.keywords.append(ast.keyword(arg=None, value=name,
+                                     lineno=1, col_offset=0))
 
-        http://www.python.org/dev/peps/pep-0227/
 
-    It seems the 3-tuple form of the exec-statement is not recognized as
-    explicitly  specifying the  local namespace  therefore creating  the
-    need to call it from an intermediate function without nested scope.
+# Python3.8 can create modified copies of code objects. This allows to reuse
+# compiled code for functions that differ only by their name. Older
+# versions have to call the constructor with all fields:
+if hasattr(types.CodeType, 'replace'):
+    def code_replace(code, **kwargs):
+        """Return a copy of ``code`` with the given fields replaced."""
+        return code.replace(**kwargs)
+else:
+    _code_fields = (
+        'co_argcount', 'co_kwonlyargcount', 'co_nlocals', 'co_stacksize',
+        'co_flags', 'co_code', 'co_consts', 'co_names', 'co_varnames',
+        'co_filename', 'co_name', 'co_firstlineno', 'co_lnotab',
+        'co_freevars', 'co_cellvars',
+    )
 
-    The  3-tuple   form  of   the  exec   statement  is   mandatory  for
-    compatibility between python2 and python3.
+    def code_replace(code, **kwargs):
+        """Return a copy of ``code`` with the given fields replaced."""
+        return types.CodeType(*[kwargs.get(field, getattr(code, field))
+                                for field in _code_fields])
 
-    http://docs.python.org/2/reference/simple_stmts.html#the-exec-statement
-    http://docs.python.org/3.3/library/functions.html?highlight=exec#exec
-    """
-    exec(expression, globals, locals)
 
+def code_relabel(code, name, filename, **kwargs):
+    """Return a copy of ``code`` with the given name and filename."""
+    if hasattr(code, 'co_qualname'):
+        kwargs['co_qualname'] = name
+    return code_replace(code, co_name=name, co_filename=filename, **kwargs)
 
-# Python3 allows unicode characters as identifiers while python2 does not:
-import re
-try:
-    exec("ä=0", {})
-    _identifier_regex = re.compile(r"^[^\d\W]\w*\Z", re.UNICODE)
-except SyntaxError:
-    _identifier_regex = re.compile(r"^[^\d\W]\w*\Z")
 
+# Python3.7 allows to change the contents of closure cells:
+cell_contents_writable = sys.version_info >= (3, 7)
 
-def is_identifier(name):
-    return _identifier_regex.match(name) is not None
 
+# Python3.8 exposes the type of closure cells:
+if hasattr(types, 'CellType'):
+    new_cell = types.CellType
+else:
+    def new_cell(*value):
+        """Create a closure cell, optionally with a value."""
+        if value:
+            content, = value
+        return (lambda: content).__closure__[0]
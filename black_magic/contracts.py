@@ -0,0 +1,279 @@
+"""
+Argument and return value checks generated from annotations.
+
+:func:`checked` creates a wrapper with the signature of the function that
+checks the annotated parameters and the return value inline, i.e. each
+check is a call of ``isinstance`` (for classes, tuples of classes and
+unions) or of the annotated predicate in the body of the wrapper:
+
+>>> @checked
+... def scale(x: int, factor: (int, float) = 2) -> int:
+...     return x * factor
+>>> scale(3)
+6
+>>> scale('a')
+Traceback (most recent call last):
+    ...
+TypeError: scale() argument 'x' must be int, not str
+>>> scale(3, 0.5)
+Traceback (most recent call last):
+    ...
+TypeError: scale() return value must be int, not float
+
+Annotations of ``*args`` and ``**kwargs`` apply to each item. Other
+annotations (e.g. strings, generic aliases like ``list[int]`` or ``typing``
+constructs that can not be used with ``isinstance``) are not checked.
+
+The checks of all wrappers can be switched off or restricted to every
+n-th call at runtime, see :func:`set_mode`.
+"""
+
+from __future__ import absolute_import
+
+
+__all__ = [
+    'checked',
+    'set_mode',
+    'get_mode',
+]
+
+
+import sys
+import types
+import itertools
+import weakref
+
+from . import common
+from . import compat
+from .decorator import ASTorator, Value, _async_kind, _forward_args
+
+
+_MODES = ('full', 'sampled', 'off')
+
+# type of PEP 585 generic aliases (python3.9):
+_GenericAlias = getattr(types, 'GenericAlias', None)
+
+# return values are checked inline using assignment expressions:
+_NAMED_EXPR = sys.version_info >= (3, 8)
+
+_mode = 'full'
+_every = 10
+
+# checked wrapper -> (decorator, values, codes by mode, spec):
+_registry = weakref.WeakKeyDictionary()
+
+
+def checked(func):
+    """
+    Check the arguments and the return value of ``func`` by annotations.
+
+    Raises ``TypeError`` if an argument is not an instance of the
+    annotated class or does not satisfy the annotated predicate. Returns
+    ``func`` itself if there is nothing to check. Coroutine functions are
+    not supported.
+    """
+    if _async_kind(func) is not None:
+        raise TypeError("Can not check coroutine functions.")
+    decorator = ASTorator.from_function(func)
+    sig = decorator.signature
+    kinds = [(name, param.kind) for name, param in sig.parameters.items()]
+    checks = []
+    for name, param in sig.parameters.items():
+        check = item = _check(param.annotation)
+        if check is None:
+            continue
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            check = ('pred', _each(item, param.kind == param.VAR_KEYWORD))
+        else:
+            item = None
+        checks.append((name, check, item))
+    ret = _check(sig.return_annotation)
+    if not checks and ret is None:
+        return func
+
+    funcname = getattr(func, '__name__', '<lambda>')
+    values = [func, _fail_args(funcname, kinds, checks), isinstance,
+              _sampler(), _fail_return(funcname, ret)]
+    values.extend(check[1] for name, check, item in checks)
+    if ret is not None:
+        values.append(ret[1])
+    spec = (kinds, checks, ret)
+    wrapper = decorator._update(
+        decorator._create(_Checked(values, spec, _mode)))
+    _registry[wrapper] = (decorator, values, {_mode: wrapper.__code__}, spec)
+    return wrapper
+
+
+def set_mode(mode, every=None):
+    """
+    Set the checking mode of all checked functions.
+
+    ``'full'`` checks every call, ``'sampled'`` checks every ``every``-th
+    call of each function (default 10), ``'off'`` only calls the function.
+    """
+    global _mode, _every
+    if mode not in _MODES:
+        raise ValueError("Unknown mode: %r" % (mode,))
+    _mode = mode
+    if every is not None:
+        _every = every
+    for wrapper, (decorator, values, codes, spec) in list(_registry.items()):
+        values[3] = _sampler()
+        code = codes.get(mode)
+        if code is None:
+            code = codes[mode] = decorator._create(
+                _Checked(values, spec, mode)).__code__
+        wrapper.__code__ = code
+
+
+def get_mode():
+    """Return the current checking mode."""
+    return _mode
+
+
+def _sampler():
+    """Return a function that returns true on every ``_every``-th call."""
+    return itertools.cycle((True,) + (False,) * (_every - 1)).__next__
+
+
+def _check(annotation):
+    """
+    Return ``('type', classinfo)`` or ``('pred', predicate)`` for an
+    annotation or ``None`` if it can not be checked.
+    """
+    if annotation is compat.Parameter.empty:
+        return None
+    if annotation is None:
+        return ('type', type(None))
+    try:
+        isinstance(None, annotation)
+    except TypeError:
+        pass
+    else:
+        return ('type', annotation)
+    # generic aliases like list[int] and typing constructs are callable,
+    # but they are not predicates:
+    if (callable(annotation) and not isinstance(annotation, type) and
+            type(annotation) is not _GenericAlias and
+            getattr(type(annotation), '__module__', None) != 'typing'):
+        return ('pred', annotation)
+    return None
+
+
+def _each(check, mapping):
+    """Return a predicate that applies ``check`` to all items."""
+    kind, test = check
+    if kind == 'type':
+        classinfo = test
+        test = lambda value: isinstance(value, classinfo)
+    if mapping:
+        return lambda items: all(test(value) for value in items.values())
+    return lambda items: all(test(value) for value in items)
+
+
+def _violation(funcname, what, check, value):
+    kind, test = check
+    if kind == 'type':
+        if isinstance(test, tuple):
+            expected = ' or '.join(_typename(t) for t in test)
+        else:
+            expected = _typename(test)
+        return "%s() %s must be %s, not %s" % (
+            funcname, what, expected, type(value).__name__)
+    return "%s() %s does not satisfy %s" % (
+        funcname, what, getattr(test, '__name__', repr(test)))
+
+
+def _typename(classinfo):
+    return getattr(classinfo, '__name__', None) or repr(classinfo)
+
+
+def _fail_args(funcname, kinds, checks):
+    """Return the function that reports the first invalid argument."""
+    index = dict((name, i) for i, (name, kind) in enumerate(kinds))
+    def valid(check, value):
+        kind, test = check
+        return isinstance(value, test) if kind == 'type' else test(value)
+    def fail(arguments):
+        for name, check, item in checks:
+            value = arguments[index[name]]
+            if item is None:
+                if not valid(check, value):
+                    raise TypeError(_violation(
+                        funcname, "argument '%s'" % name, check, value))
+                continue
+            items = value.values() if isinstance(value, dict) else value
+            for value in items:
+                if not valid(item, value):
+                    raise TypeError(_violation(
+                        funcname, "argument '%s' item" % name, item, value))
+    return fail
+
+
+def _fail_return(funcname, check):
+    """
+    Return the function that reports an invalid return value.
+
+    Without assignment expressions, the function checks the return value
+    itself and returns it if it is valid.
+    """
+    def fail(value):
+        raise TypeError(_violation(funcname, "return value", check, value))
+    if _NAMED_EXPR or check is None:
+        return fail
+    kind, test = check
+    if kind == 'type':
+        return lambda value: value if isinstance(value, test) else fail(value)
+    return lambda value: value if test(value) else fail(value)
+
+
+class _Checked(Value):
+
+    """
+    Call ``values[0]`` with the parameters and check the arguments and
+    return value according to ``spec`` and the checking ``mode``.
+
+    The checks refer to the ``values`` by index: the function, the
+    argument failure handler, ``isinstance``, the sampler, the return
+    failure handler, then the classes or predicates of the arguments and
+    of the return value.
+    """
+
+    def __init__(self, values, spec, mode):
+        self.value = values
+        self.spec = spec
+        self.mode = mode
+
+    def ast(self, value_name):
+        import ast
+        kinds, checks, ret = self.spec
+        v = value_name
+
+        call = '%s[0](%s)' % (v, ', '.join(_forward_args(kinds)))
+        if self.mode == 'off':
+            return ast.parse(call, mode='eval').body
+
+        def test(expr, check, index):
+            if check[0] == 'type':
+                return '%s[2](%s, %s[%d])' % (v, expr, v, index)
+            return '%s[%d](%s)' % (v, index, expr)
+
+        conditions = [test(name, check, 5 + i)
+                      for i, (name, check, item) in enumerate(checks)]
+        full = call
+        if ret is not None and not _NAMED_EXPR:
+            full = '%s[4](%s)' % (v, call)
+        elif ret is not None:
+            scope = common.Scope([name for name, kind in kinds] + [v])
+            result = scope.reserve('_bm_result')
+            full = '(%s if %s else %s[4](%s))' % (
+                result, test('(%s := %s)' % (result, call), ret,
+                             5 + len(checks)),
+                v, result)
+        if conditions:
+            full = '(%s if %s else %s[1]((%s,)))' % (
+                full, ' and '.join(conditions), v,
+                ', '.join(name for name, kind in kinds))
+        if self.mode == 'sampled':
+            full = '(%s if %s[3]() else %s)' % (full, v, call)
+        return ast.parse(full, mode='eval').body
@@ -16,12 +16,15 @@ __all__ = [
     'flatorator',
     'metapartial',
     'partial',
+    'BoundArguments',
+    'BoundArgSpec',
 ]
 
 
-import ast
-import inspect
-import functools
+import os
+import sys
+import types
+import operator
 
 from . import compat
 from . import common
@@ -33,8 +36,44 @@ class ASTorator(object):
     Creates wapper functions with specific signature.
 
     Uses abstract syntax trees for dynamic code generation.
+
+    Wrappers are usually instanciated from precompiled code templates that
+    depend only on the parameter kinds. The template is copied with the
+    actual parameter names and defaults and annotations are attached to
+    the new function directly. Templates are kept in the bounded cache
+    ``ASTorator.template_cache``, their copies for a given function name
+    and filename in ``ASTorator.specialized_cache``.
+
+    Custom :class:`Value` expressions and ``ast.expr`` callbacks are
+    compiled from a complete syntax tree. The resulting code is shared between all
+    instances whose signatures have the same shape, i.e. the same
+    parameter names and kinds and the same presence of defaults and
+    annotations, see ``ASTorator.code_cache``.
+
+    Both kinds of code can additionally be stored in a persistent cache,
+    see :mod:`black_magic.diskcache`.
+
+    The signatures of wrapped functions are kept in
+    ``ASTorator.signature_cache``.
+
+    If ``instrument`` is true, wrappers created from templates record call
+    statistics, see :mod:`black_magic.stats`.
     """
 
+    code_cache = common.LRUCache(maxsize=1024)
+    template_cache = common.LRUCache(maxsize=256)
+    specialized_cache = common.LRUCache(maxsize=1024)
+    signature_cache = common.SignatureCache()
+    disk_cache = None
+    instrument = False
+
+    # 'async' or 'asyncgen' for coroutine or async generator functions:
+    _async = None
+
+    # function whose signature is computed on demand, see _code_decorator:
+    _function = None
+    _signature = None
+
     def __init__(self, signature, funcname=None, filename=None,
                  assign=None, update=None):
         self.signature = signature
@@ -54,58 +93,123 @@ class ASTorator(object):
         different from the signature of ``function``. In this case,
         ``function`` will only be used to copy docstring and other
         information.
+
+        The filename is taken from the code object of ``function`` without
+        accessing the file system, see :attr:`sourcefile`.
         """
 
         # this actually changes the signature for functools.partials
         # effectively, but it plays nicely with the rest of this library:
-        if isinstance(function, functools.partial) and function.keywords:
+        if isinstance(function, compat.functools_partial) and function.keywords:
             function = partial(function)
-        try:
-            filename = inspect.getsourcefile(function)
-        except:
-            filename = None
-        if compat.is_identifier(getattr(function, '__name__', '')):
-            funcname = function.__name__
-        else:
-            funcname = None
+        funcname, filename, assign, update = _function_info(function)
+        decorator = cls(signature or cls.signature_cache(function),
+                        funcname=funcname, filename=filename,
+                        assign=assign, update=update)
+        decorator._async = _async_kind(function)
+        return decorator
+
+    @property
+    def signature(self):
+        """
+        The signature of the wrappers.
+
+        Decorators for lazy wrappers compute it from the wrapped function on
+        first access, see :meth:`decorate_lazy`.
+        """
+        if self._signature is None and self._function is not None:
+            self._signature = self.signature_cache(self._function)
+        return self._signature
 
-        assign = dict((attr, getattr(function, attr))
-                      for attr in ('__module__', '__name__', '__qualname__',
-                                   '__doc__', '__annotations__')
-                      if hasattr(function, attr))
-        update = {'__dict__': function.__dict__}
+    @signature.setter
+    def signature(self, signature):
+        self._signature = signature
 
-        return cls(signature or compat.signature(function),
-                   funcname=funcname, filename=filename,
-                   assign=assign, update=update)
+    @property
+    def sourcefile(self):
+        """
+        The source file of the wrapped function, or ``None``.
+
+        Resolved from ``filename`` in the same manner as by
+        ``inspect.getsourcefile`` on first access.
+        """
+        try:
+            return self._sourcefile
+        except AttributeError:
+            self._sourcefile = _sourcefile(self.filename)
+            return self._sourcefile
 
     def _init(self):
 
-        """Create signature and call ast."""
+        """Collect parameter names, defaults and annotations."""
+
+        empty = self.signature.empty
+        names = []
+        kinds = []
+        defaults = []
+        kwdefaults = {}
+        annotations = {}
+        for name, param in self.signature.parameters.items():
+            names.append(name)
+            kinds.append(int(param.kind))
+            if param.default is not empty:
+                if param.kind == param.KEYWORD_ONLY:
+                    kwdefaults[name] = param.default
+                else:
+                    defaults.append(param.default)
+            if param.annotation is not empty:
+                annotations[name] = param.annotation
+        if self.signature.return_annotation is not empty:
+            annotations['return'] = self.signature.return_annotation
+
+        self._kinds = tuple(kinds)
+        self._call_layout = _identity_layout(kinds)
+
+        # the code object lists positional parameters, then keyword-only
+        # parameters, then the variable length parameters:
+        order = {
+            int(compat.Parameter.VAR_POSITIONAL): 1,
+            int(compat.Parameter.VAR_KEYWORD): 2,
+        }
+        self._varnames = tuple(
+            name for kind, name in sorted(
+                zip(kinds, names), key=lambda p: order.get(p[0], 0)))
+        self._defaults = tuple(defaults) or None
+        self._kwdefaults = kwdefaults or None
+        self._annotations = annotations
+        self._filename = '<wraps(%s:%s)>' % (self.filename or '?',
+                                            self.funcname)
+        self._shape = None
+
+    def _init_ast(self):
+
+        """Compute the shape of the signature and the name of the callback."""
 
         scope = common.Scope(self.signature.parameters.keys())
-        context = {}
+        shape = tuple((name, int(param.kind))
+                      for name, param in self.signature.parameters.items())
 
-        filename = '<wraps(%s:%s)>' % (self.filename or '?', self.funcname)
-        callback_name = scope.reserve('_call')
+        # the function name and filename are patched into shared code, only
+        # lambdas need to be compiled differently:
+        label = self.funcname is None
 
-        # Add a value to the context
-        empty = self.signature.empty
-        def _hasattr(param, attr):
-            return not getattr(param, attr, empty) is empty
+        self._callback_name = scope.reserve('_call')
+        self._item_name = scope.reserve('_bm_item')
+        self._shape = (label, shape)
 
-        def attr(param, attr):
-            if _hasattr(param, attr):
-                return ast.Attribute(
-                    lineno=1, col_offset=0,
-                    value=ast.Name(id=param.name, ctx=ast.Load(),
-                                   lineno=1, col_offset=0),
-                    attr=attr,
-                    ctx=ast.Load())
-            else:
-                return None
+    def _build_ast(self):
+
+        """
+        Create signature and call ast.
 
-        sig = ast.arguments(
+        The signature has no defaults and annotations, they are attached to
+        the function object after compilation.
+        """
+
+        import ast
+        callback_name = self._callback_name
+
+        sig = compat.ast_arguments(
             args=[],
             vararg=None,
             varargannotation=None,
@@ -125,145 +229,971 @@ class ASTorator(object):
 
         for name, param in self.signature.parameters.items():
 
-            context[name] = param
             ast_name = ast.Name(id=name, ctx=ast.Load(), lineno=1, col_offset=0)
+            ast_arg = compat.ast_arg(lineno=1, col_offset=0,
+                                     arg=name, annotation=None)
 
             # positional parameters
             if param.kind == param.POSITIONAL_OR_KEYWORD:
-                sig.args.append(compat.ast_arg(
-                    lineno=1, col_offset=0,
-                    arg=name,
-                    annotation=attr(param, 'annotation')))
+                sig.args.append(ast_arg)
+                call.args.append(ast_name)
+
+            # positional only
+            elif param.kind == param.POSITIONAL_ONLY:
+                sig.posonlyargs.append(ast_arg)
                 call.args.append(ast_name)
-                if _hasattr(param, 'default'):
-                    sig.defaults.append(attr(param, 'default'))
 
             # keyword only
             elif param.kind == param.KEYWORD_ONLY:
-                sig.kwonlyargs.append(compat.ast_arg(
-                    lineno=1, col_offset=0,
-                    arg=name,
-                    annotation=attr(param, 'annotation')))
+                sig.kwonlyargs.append(ast_arg)
                 call.keywords.append(ast.keyword(
+                    lineno=1, col_offset=0,
                     arg=name,
                     value=ast_name))
-                sig.kw_defaults.append(attr(param, 'default'))
+                sig.kw_defaults.append(None)
 
             # varargs
             elif param.kind == param.VAR_POSITIONAL:
-                compat.ast_set_special_arg('vararg', sig,
-                                           name, attr(param, 'annotation'))
+                compat.ast_set_special_arg('vararg', sig, name, None)
                 compat.ast_call_unpack_stararg(call, ast_name)
 
             # kwargs
             elif param.kind == param.VAR_KEYWORD:
-                compat.ast_set_special_arg('kwarg', sig,
-                                           name, attr(param, 'annotation'))
+                compat.ast_set_special_arg('kwarg', sig, name, None)
                 compat.ast_call_unpack_kwarg(call, ast_name)
 
             else:
                 raise ValueError("Cannot handle parameter type: %s" % param)
 
-        if _hasattr(self.signature, 'return_annotation'):
-            retannot_name = scope.reserve('_returns')
-            context[retannot_name] = self.signature.return_annotation
-            returns = ast.Name(id=retannot_name, ctx=ast.Load(),
-                               lineno=1, col_offset=0)
-        else:
-            returns = None
-
-        self._call = call
-        self._sig = sig
-        self._context = context
-        self._callback_name = callback_name
-        self._filename = filename
-        self._returns = returns
+        return sig, call
 
     def decorate(self, callback):
 
         """
         Create wrapper for callback.
 
-        The callback may be a function, lambda or any ast.expr.
+        The callback may be a function, lambda or any ast.expr. If it is
+        a wrapper generated for the same parameters, the new wrapper calls
+        through to its callback directly, i.e. stacked wrappers execute in
+        a single frame.
+
+        If the callback is a coroutine function, the wrapper is a coroutine
+        function that awaits the callback. For async generator functions,
+        the wrapper iterates over the callback with ``async for`` and
+        yields the items. The result of a synchronous callback is returned
+        unchanged.
         """
+        return self._update(self._create(callback))
 
-        call = self._call
-        sig = self._sig
-        context = self._context.copy()
-        callback_name = self._callback_name
-        filename = self._filename
-        returns = self._returns
+    def decorate_with_args(self, callback, *args):
+
+        """
+        Create wrapper that calls ``callback(*args, <parameters>)``.
+
+        The ``args`` are stored as constants in the code of the wrapper,
+        so they are passed without any intermediate function call.
+        """
+        return self._update(self._create(callback, args))
+
+    def decorate_lazy(self, callback, args=()):
+
+        """
+        Create a stub that generates the wrapper for callback when called.
+
+        The stub looks like the wrapper, i.e. it has the same signature
+        (via ``__signature__``, or ``__wrapped__`` if the signature has not
+        been computed yet) and attributes. On the first call it takes over
+        the code of the generated wrapper. Leading ``args`` for the callback
+        can be given as for :meth:`decorate_with_args`.
+        """
+
+        namespace = {'__builtins__': __builtins__}
+        instrument = self.instrument
+        mode = self._async_mode(
+            callback, isinstance(callback, Value) or _is_ast_expr(callback))
+        if self._kinds is not None and not args:
+            forward = _forward_target(callback, self._kinds, self._varnames)
+            if forward is not None and _async_kind(forward[0]) == mode:
+                callback, args = forward
+        def compile_stub():
+            func = self._create(callback, args, instrument)
+            closure = func.__closure__ or ()
+            if (not compat.cell_contents_writable or
+                    len(closure) != len(stub.__closure__ or ())):
+                # unexpected layout, keep forwarding to the wrapper:
+                namespace['_compile_stub'] = lambda: func
+            else:
+                for cell, value in zip(stub.__closure__ or (), closure):
+                    cell.cell_contents = value.cell_contents
+                namespace.update(func.__globals__)
+                stub.__code__ = func.__code__
+                stub.__defaults__ = func.__defaults__
+                stub.__kwdefaults__ = func.__kwdefaults__
+            if instrument:
+                from . import stats
+                stats._move(func, stub)
+            return func
+
+        # the code of the wrapper will be swapped in, so the stub must have
+        # the same number of free variables:
+        if self._kinds is None or _is_ast_expr(callback) or (
+                isinstance(callback, Value) and
+                type(callback).ast is not Value.ast):
+            num_free = 0
+        else:
+            # constants are embedded in the code, not passed in a cell:
+            num_free = (len(args) +
+                        (not isinstance(callback, Value) or
+                         not _is_const(callback.value)) +
+                        (_INSTRUMENT_FREE if instrument else 0))
+        closure = tuple(_new_cell() for _ in range(num_free)) or None
+        namespace['_compile_stub'] = compile_stub
+        stub = types.FunctionType(_lazy_stub(num_free, mode), namespace,
+                                  self.funcname or '<lambda>', None, closure)
+        if self._annotations:
+            stub.__annotations__ = self._annotations.copy()
+        stub = self._update(stub)
+        if self._signature is None and self._function is not None:
+            # let inspect compute the signature when it is needed:
+            stub.__wrapped__ = self._function
+        else:
+            stub.__signature__ = self.signature
+        return stub
+
+    def _create(self, callback, args=(), instrument=None):
+
+        """Create wrapper for callback, without updating its attributes."""
 
         # make functools.partial objects behave nice
-        if isinstance(callback, functools.partial) and callback.keywords:
+        if isinstance(callback, compat.functools_partial) and callback.keywords:
             callback = partial(callback)
 
+        func = None
+        if self._kinds is not None and not args:
+            # call through another wrapper with the same parameters:
+            forward = _forward_target(callback, self._kinds, self._varnames)
+            if forward is not None and (
+                    _async_kind(forward[0]) == _async_kind(callback)):
+                callback, args = forward
+        if args:
+            if self._kinds is not None:
+                call_args, keywords = self._call_layout
+                layout = ((None,) * len(args) + call_args, keywords)
+                return self._instanciate(callback, layout, args,
+                                         instrument=instrument)
+            callback = compat.functools_partial(callback, *args)
+
+        if self._kinds is not None and not _is_ast_expr(callback):
+            if not isinstance(callback, Value):
+                func = self._instanciate(callback, self._call_layout,
+                                         instrument=instrument)
+            # custom expression generators need the AST backend:
+            elif type(callback).ast is Value.ast:
+                body = 'const' if _is_const(callback.value) else 'value'
+                func = self._instanciate(callback.value, body,
+                                         instrument=instrument)
+        if func is None:
+            func = self._decorate_ast(callback)
+        return func
+
+    def _instanciate(self, callback, body, consts=(), namespace=None,
+                     instrument=None):
+
+        """
+        Create wrapper for callback from a precompiled code template.
+
+        ``body`` is either ``'value'`` to return the callback itself,
+        ``'const'`` to return it as a constant of the code object (see
+        :func:`_is_const`), a call layout (see :func:`_layout_call`) to
+        call it, or ``'boundargs'`` or
+        ``'boundargspec'`` to call it with the arguments collected by
+        ``_bound``. The ``consts`` are the values for the constant slots in
+        the body. ``namespace`` provides further free variables. Pass
+        ``instrument`` to override ``self.instrument``.
+
+        The callback, constants and namespace are passed in closure cells,
+        all wrappers share the code object (if they have the same name and
+        parameters) and an empty globals dict.
+        """
+
+        if instrument is None:
+            instrument = self.instrument
+        value = body in ('value', 'const')
+        mode = self._async_mode(callback, value)
+        if mode is not None:
+            body = (mode, body)
+        if instrument:
+            from . import stats
+            body = ('instrument', body)
+            namespace = dict(namespace or (), **stats._namespace())
+        key = (self._kinds, body, self._varnames,
+               self.funcname, self._filename)
+        code, free = self.specialized_cache.get_or_create(
+            key, lambda: self._specialize(body))
+        if body == 'const':
+            code = _embed_const(code, callback)
+        values = {'_call': callback}
+        values.update(('_bm_c%d' % i, value) for i, value in enumerate(consts))
+        if namespace:
+            values.update(namespace)
+        func = types.FunctionType(code, _globals, code.co_name,
+                                  self._defaults,
+                                  tuple(_new_cell(values[n]) for n in free))
+        func.__kwdefaults__ = self._kwdefaults
+        if self._annotations:
+            func.__annotations__ = self._annotations.copy()
+        if instrument:
+            stats._register(func, namespace)
+        return func
+
+    def _async_mode(self, callback, value=False):
+
+        """
+        Return ``'async'`` or ``'asyncgen'`` if the wrapper for callback
+        must be asynchronous, else ``None``.
+
+        Only asynchronous callbacks are awaited (or iterated), the result of
+        a synchronous callback is returned as is. Pass ``value=True`` if the
+        wrapper returns the callback instead of calling it, it is then only
+        a coroutine function if the wrapped function is one.
+        """
+
+        if value:
+            return 'async' if self._async == 'async' else None
+        return _async_kind(callback)
+
+    def _specialize(self, body):
+
+        """
+        Copy the code template and insert the actual parameter names.
+
+        Returns the code and the names of its free variables in the
+        template.
+        """
+
+        template = self._cached(self.template_cache, (self._kinds, body),
+                                _compile_template, self._kinds, body)
+
+        # local and free variables of the template must not clash with the
+        # parameters:
+        varnames = self._varnames
+        scope = common.Scope(varnames)
+        varnames += tuple(scope.reserve(name)
+                          for name in template.co_varnames[len(varnames):])
+        freevars = tuple(scope.reserve(name) for name in template.co_freevars)
+
+        # keyword-only parameters are passed by name, i.e. their canonical
+        # names also occur in the constants of the template. Layouts must
+        # not contain literal keyword names, they would be renamed as well:
+        renames = dict(zip(template.co_varnames, varnames))
+        consts = tuple(_replace_const(c, renames) for c in template.co_consts)
+
+        code = compat.code_relabel(
+            template, self.funcname or '<lambda>', self._filename,
+            co_varnames=varnames, co_freevars=freevars, co_consts=consts)
+        if body[0] in ('async', 'asyncgen'):
+            body = body[1]
+        if type(body[0]) is tuple:
+            prefix = _forward_prefix(body, self._call_layout)
+            if prefix is not None:
+                _register_forward(code, (self._kinds, self._varnames, prefix,
+                                         template.co_freevars))
+        return code, template.co_freevars
+
+    @classmethod
+    def _cached(cls, cache, key, compile, *args):
+
+        """
+        Lookup code in the given cache or create it by ``compile(*args)``.
+
+        Consults the persistent ``disk_cache`` (if enabled) before
+        compiling. Concurrent requests for the same key compile only once.
+        """
+
+        def create():
+            disk_cache = cls.disk_cache
+            disk_key = (cache is cls.template_cache, key)
+            code = None
+            if disk_cache is not None:
+                code = disk_cache.get(disk_key)
+            if code is None:
+                code = compile(*args)
+                if disk_cache is not None:
+                    disk_cache[disk_key] = code
+            return code
+        return cache.get_or_create(key, create)
+
+    def _decorate_ast(self, callback):
+
+        """Create wrapper for callback by compiling its AST."""
+
+        import ast
+        if self._shape is None:
+            self._init_ast()
+
+        callback_name = self._callback_name
+        filename = self._filename
+        globals = {}
+
         # TODO: check whether the callback has compatible signature
 
         # THIS IS SOMEWHAT DANGEROUS, BUT ALSO REALLY COOL:
         if isinstance(callback, ast.expr):
             call = ast.fix_missing_locations(callback)
+            key = ('expr', ast.dump(call))
 
         # custom expression generator
         elif isinstance(callback, Value):
-            context[callback_name] = callback.value
+            globals[callback_name] = callback.value
             call = callback.ast(callback_name)
+            key = ('value', ast.dump(call))
 
         # Functions just get called:
         else:
-            context[callback_name] = callback
+            globals[callback_name] = callback
+            call = None
+            key = ('call',)
+
+        mode = self._async_mode(callback, call is not None)
+        code = self._cached(self.code_cache, (self._shape, key, mode),
+                            self._compile, call, mode)
 
-        # generate and evaluate the complete expression
+        # evaluate the complete expression
         loc = {}
-        if self.funcname is None:
+        if self.funcname is None and mode is None:
+            func = eval(code, globals, loc)
+        else:
+            exec(code, globals, loc)
+            func, = loc.values()
+
+        # code shared with other wrappers carries their name and filename:
+        name = self.funcname or '<lambda>'
+        code = func.__code__
+        if code.co_name != name or code.co_filename != filename:
+            func.__code__ = compat.code_relabel(code, name, filename)
+            func.__name__ = func.__qualname__ = name
+
+        if isinstance(callback, Value) and _is_const(callback.value):
+            func.__code__ = _embed_const(func.__code__, callback.value)
+
+        func.__defaults__ = self._defaults
+        func.__kwdefaults__ = self._kwdefaults
+        if self._annotations:
+            func.__annotations__ = self._annotations.copy()
+        return func
+
+    def _compile(self, call=None, mode=None):
+
+        """
+        Compile the code that defines the wrapper function.
+
+        The function returns ``call`` or calls the callback with all
+        parameters by default. For ``mode='async'`` it is a coroutine
+        function that awaits the callback (but not ``call``), for
+        ``mode='asyncgen'`` an async generator that yields the items of the
+        callback. Lambdas can not be asynchronous, in this case a function
+        is defined. The syntax tree is not kept.
+        """
+
+        import ast
+        sig, default_call = self._build_ast()
+        if call is None:
+            body = _call_statements(default_call, mode, self._item_name)
+        else:
+            body = _call_statements(call, None, self._item_name)
+        if self.funcname is None and mode is None:
             expr = ast.Expression(body=ast.Lambda(
                 lineno=1, col_offset=0,
                 args=sig,
-                body=call
+                body=body[0].value
             ))
-            code = compile((expr), filename, 'eval')
-            return self._update(eval(code, context, loc))
-
+            return compile(expr, self._filename, 'eval')
         else:
-            expr = ast.Module(body=[
-                ast.FunctionDef(
+            define = ast.AsyncFunctionDef if mode else ast.FunctionDef
+            expr = compat.ast_module([
+                define(
                     lineno=1, col_offset=0,
-                    name=self.funcname,
+                    name=self.funcname or '_bm_lambda',
                     args=sig,
-                    body=[ast.Return(value=call,
-                                     lineno=1, col_offset=0)],
+                    body=body,
                     decorator_list=[],
-                    returns=returns)
+                    returns=None)
             ])
-            code = compile(expr, filename, 'exec')
-            compat.exec_compat(code, context, loc)
-            return self._update(loc[self.funcname])
+            return compile(expr, self._filename, 'exec')
 
     def _update(self, func):
         for k,v in self.assign.items():
             setattr(func, k, v)
         for k,v in self.update.items():
-            getattr(func, k).update(v)
+            # don't create empty dicts:
+            if v:
+                getattr(func, k).update(v)
+        # the signature is implemented by the code itself (except for lazy
+        # stubs), a copied signature might be wrong:
+        if '__signature__' in self.update.get('__dict__', ()):
+            del func.__signature__
         return func
 
     __call__ = decorate
 
 
     def decorate_with_boundargspec(self, function):
-        """Create wrapper that calls function with a BoundArgSpec."""
-        raise NotImplementedError()
+
+        """
+        Create wrapper that calls function with a :class:`BoundArgSpec`.
+
+        The argspec is built directly from the parameters of the wrapper.
+        """
+
+        if self._kinds is not None:
+            return self._update(self._instanciate(
+                function, 'boundargspec', namespace={'_bound': BoundArgSpec}))
+        return self.decorate(
+            lambda *args, **kwargs:
+                function(self._bind(*args, **kwargs).argspec()))
 
     def decorate_with_boundargs(self, function):
-        """Create a wrapper that calls function with a BoundArgs."""
+
+        """
+        Create a wrapper that calls function with a :class:`BoundArguments`.
+
+        The bound arguments are built directly from the parameters of the
+        wrapper, i.e. they include the values of omitted defaults.
+        """
+
+        if self._kinds is not None:
+            return self._update(self._instanciate(
+                function, 'boundargs', (self._argument_layout(),),
+                namespace={'_bound': BoundArguments}))
         return self.decorate(
             lambda *args, **kwargs:
-                function(self.signature.bind(*args, **kwargs)))
+                function(self._bind(*args, **kwargs)))
+
+    def _argument_layout(self):
+        """Return the parameter layout for :class:`BoundArguments`."""
+        positional = []
+        var_pos = None
+        keyword = []
+        var_kw = None
+        for name, param in self.signature.parameters.items():
+            if param.kind == param.VAR_POSITIONAL:
+                var_pos = name
+            elif param.kind == param.VAR_KEYWORD:
+                var_kw = name
+            elif param.kind == param.KEYWORD_ONLY:
+                keyword.append(name)
+            else:
+                positional.append(name)
+        return (self.signature, tuple(positional), var_pos,
+                tuple(keyword), var_kw)
+
+    def _bind(self, *args, **kwargs):
+        """Bind arguments using the signature (AST backend)."""
+        bound = self.signature.bind(*args, **kwargs).arguments
+        arguments = {}
+        for name, param in self.signature.parameters.items():
+            if name in bound:
+                arguments[name] = bound[name]
+            elif param.kind == param.VAR_POSITIONAL:
+                arguments[name] = ()
+            elif param.kind == param.VAR_KEYWORD:
+                arguments[name] = {}
+            else:
+                arguments[name] = param.default
+        return BoundArguments((self._argument_layout(), arguments))
+
+
+def _function_info(function):
+    """Return ``(funcname, filename, assign, update)`` for a function."""
+    code = getattr(function, '__code__', None)
+    filename = getattr(code, 'co_filename', None)
+    if getattr(function, '__name__', '').isidentifier():
+        funcname = function.__name__
+    else:
+        funcname = None
+
+    assign = dict((attr, getattr(function, attr))
+                  for attr in ('__module__', '__name__', '__qualname__',
+                               '__doc__', '__annotations__')
+                  if hasattr(function, attr))
+    extra = function.__dict__
+    if ('__wrapped__' in extra and
+            '_compile_stub' in getattr(function, '__globals__', ())):
+        # the function the signature of a lazy stub refers to is not
+        # wrapped by other wrappers:
+        extra = dict(extra)
+        del extra['__wrapped__']
+    update = {'__dict__': extra}
+    return funcname, filename, assign, update
+
+
+def _sourcefile(filename):
+    """Return the source file for a code filename if it can be found."""
+    if not filename:
+        return None
+    from importlib.machinery import BYTECODE_SUFFIXES, SOURCE_SUFFIXES
+    if filename.endswith(tuple(BYTECODE_SUFFIXES)):
+        filename = os.path.splitext(filename)[0] + SOURCE_SUFFIXES[0]
+    if os.path.exists(filename):
+        return filename
+    import linecache
+    if filename in linecache.cache:
+        return filename
+    return None
+
+
+_CO_COROUTINE = 0x0080
+_CO_ASYNC_GENERATOR = 0x0200
+
+
+def _async_kind(func):
+    """
+    Return ``'async'`` for coroutine functions, ``'asyncgen'`` for async
+    generator functions and ``None`` for other callables.
+    """
+    while isinstance(func, compat.functools_partial):
+        func = func.func
+    func = getattr(func, '__func__', func)
+    flags = getattr(getattr(func, '__code__', None), 'co_flags', 0)
+    if flags & _CO_COROUTINE:
+        return 'async'
+    if flags & _CO_ASYNC_GENERATOR:
+        return 'asyncgen'
+    return None
+
+
+def _call_statements(expr, mode, item):
+    """
+    Return the body of a wrapper that evaluates ``expr``.
+
+    Awaits ``expr`` for ``mode='async'`` and yields its items using the
+    variable ``item`` for ``mode='asyncgen'``.
+    """
+    import ast
+    if mode == 'asyncgen':
+        return [ast.AsyncFor(
+            lineno=1, col_offset=0,
+            target=ast.Name(id=item, ctx=ast.Store(), lineno=1, col_offset=0),
+            iter=expr,
+            body=[ast.Expr(
+                lineno=1, col_offset=0,
+                value=ast.Yield(
+                    lineno=1, col_offset=0,
+                    value=ast.Name(id=item, ctx=ast.Load(),
+                                   lineno=1, col_offset=0)))],
+            orelse=[])]
+    if mode == 'async':
+        expr = ast.Await(value=expr, lineno=1, col_offset=0)
+    return [ast.Return(value=expr, lineno=1, col_offset=0)]
+
+
+def _is_ast_expr(obj):
+    """Check for an ``ast.expr`` without importing the ast module."""
+    ast = sys.modules.get('ast')
+    return ast is not None and isinstance(obj, ast.expr)
+
+
+# globals shared by all wrappers created from templates (before python3.10
+# functions do not fall back to the builtins of the current frame):
+_globals = {'__builtins__': __builtins__}
+
+# number of free variables added by _instrument:
+_INSTRUMENT_FREE = 4
+
+
+def _new_cell(*value):
+    """Create a closure cell, optionally with a value."""
+    return compat.new_cell(*value)
+
+
+# code of wrappers that pass their parameters unchanged to the callback
+# -> (kinds, varnames, number of leading constants, template freevars):
+_forwards = None
+
+
+def _register_forward(code, entry):
+    global _forwards
+    if _forwards is None:
+        import weakref
+        _forwards = weakref.WeakKeyDictionary()
+    try:
+        _forwards[code] = entry
+    except TypeError:
+        # code with unhashable constants, the wrapper is not fused:
+        pass
+
+
+def _forward_entry(code):
+    """Return the registered entry for ``code`` or ``None``."""
+    if _forwards is None:
+        return None
+    try:
+        return _forwards.get(code)
+    except TypeError:
+        return None
+
+
+def _forward_prefix(layout, identity):
+    """
+    Check whether a call layout passes on all parameters unchanged.
+
+    Returns the number of leading constants or ``None``.
+    """
+    args, keywords = layout
+    num = len(args) - len(identity[0])
+    if (num >= 0 and args[:num] == (None,) * num and
+            args[num:] == identity[0] and keywords == identity[1]):
+        return num
+    return None
+
 
+def _forward_target(func, kinds=None, varnames=None):
+    """
+    Return ``(callback, args)`` if ``func`` is a generated wrapper that
+    calls ``callback(*args, <parameters>)`` with the given parameters
+    (or any parameters if ``kinds`` is ``None``).
+
+    A wrapper with the same parameters can call the callback directly,
+    i.e. stacked wrappers are fused into a single frame. Their defaults
+    don't matter, since all parameters are passed explicitly.
+    """
+    if _forwards is None or type(func) is not types.FunctionType:
+        return None
+    entry = _forward_entry(func.__code__)
+    if entry is None or kinds is not None and (
+            entry[0] != kinds or entry[1] != varnames):
+        return None
+    cells = dict(zip(entry[3], func.__closure__))
+    return (cells['_call'].cell_contents,
+            tuple(cells['_bm_c%d' % i].cell_contents
+                  for i in range(entry[2])))
+
+
+def _relabel(func, funcname, filename):
+    """
+    Change the name and filename of the code of a generated wrapper.
+
+    The wrapper can still be fused with wrappers around it.
+    """
+    code = func.__code__
+    func.__code__ = compat.code_relabel(code, funcname, filename)
+    entry = _forward_entry(code)
+    if entry is not None:
+        _register_forward(func.__code__, entry)
+    return func
+
+
+def _lazy_stub(num_free, mode=None, _codes={}):
+
+    """
+    Return the code for :meth:`ASTorator.decorate_lazy`.
+
+    The stub calls ``_compile_stub()(*args, **kwargs)`` and has
+    ``num_free`` (unused) free variables. With ``mode='async'`` or
+    ``mode='asyncgen'`` it awaits or iterates the result like the wrapper.
+    """
+
+    code = _codes.get((num_free, mode))
+    if code is None:
+        free = ', '.join('_bm_f%d' % i for i in range(num_free))
+        call = "_compile_stub()(*args, **kwargs)"
+        if mode == 'asyncgen':
+            body = "async for _bm_item in %s:\n            yield _bm_item" % call
+        elif mode == 'async':
+            body = "return await " + call
+        else:
+            body = "return " + call
+        source = (
+            "def _bm_outer(%s):\n"
+            "    %sdef _bm_stub(*args, **kwargs):\n"
+            "        if 0: (%s)\n"
+            "        %s\n"
+            "    return _bm_stub\n") % (free, 'async ' if mode else '',
+                                      free, body)
+        code = _codes[num_free, mode] = _nested_code(
+            compile(source, '<lazy>', 'exec'))
+    return code
+
+
+# placeholder for the values embedded by _embed_const:
+_CONST = '_bm_const'
+
+
+# types of the values that can be embedded by _embed_const:
+_CONST_TYPES = (type(None), type(Ellipsis), bool, int, float, complex,
+                str, bytes)
+
+
+def _is_const(value):
+    """
+    Return whether ``value`` can be a constant of a code object.
+
+    Only immutable values of builtin types (and tuples and frozensets of
+    them) are embedded, so that the code stays hashable and marshallable.
+    """
+    if type(value) in (tuple, frozenset):
+        return all(_is_const(item) for item in value)
+    return type(value) in _CONST_TYPES
+
+
+def _embed_const(code, value):
+    """
+    Replace the placeholder ``_CONST`` in the constants of ``code``.
+
+    The compiler only accepts literals as constants, but code objects can
+    hold any value for which :func:`_is_const` is true, it is then loaded by
+    ``LOAD_CONST``.
+    """
+    consts = code.co_consts
+    if _CONST not in consts:
+        return code
+    return compat.code_replace(code, co_consts=tuple(
+        value if type(c) is str and c == _CONST else c for c in consts))
+
+
+def _nested_code(code):
+    """Return the code of the function defined in the function in code."""
+    for outer in code.co_consts:
+        if isinstance(outer, types.CodeType):
+            for inner in outer.co_consts:
+                if isinstance(inner, types.CodeType):
+                    return inner
 
-def wraps(function=None, wrapper=None, signature=None):
+
+def _compile_template(kinds, body):
+    """
+    Compile the code of a wrapper function with the given parameter kinds.
+
+    The parameters get canonical names and have no defaults. The callback
+    is the free variable ``_call``, constant slots are ``_bm_c0, _bm_c1,
+    ...``. The ``'value'`` body returns ``_call`` itself, the ``'const'``
+    body the placeholder ``_CONST``. The type of bound arguments for the
+    ``'boundargs'`` and ``'boundargspec'`` bodies is ``_bound``.
+    ``('async', body)`` and ``('asyncgen', body)`` create asynchronous
+    wrappers, see :func:`_call_statements`.
+    ``('instrument', body)`` records call statistics around ``body``, see
+    :func:`_instrument`.
+    """
+    import ast
+    Parameter = compat.Parameter
+    signature = compat.Signature([
+        Parameter('_bm_%d' % i, kind)
+        for i, kind in enumerate(kinds)
+    ])
+    astorator = ASTorator(signature, funcname='_bm_template')
+    astorator._init_ast()
+    sig, _ = astorator._build_ast()
+    callback = ast.Name(id='_call', ctx=ast.Load(), lineno=1, col_offset=0)
+    names = list(signature.parameters)
+    instrument = body[0] == 'instrument'
+    if instrument:
+        body = body[1]
+    mode = None
+    if body[0] in ('async', 'asyncgen'):
+        mode, body = body
+    if body == 'value':
+        expr = callback
+    elif body == 'const':
+        expr = ast.Constant(value=_CONST, lineno=1, col_offset=0)
+    elif body in ('boundargs', 'boundargspec'):
+        expr = _bound_call(callback, body, kinds, names)
+    else:
+        expr = _layout_call(callback, body, names)
+    value = body in ('value', 'const')
+    statements = _call_statements(expr, None if value else mode, '_bm_item')
+    if instrument:
+        statements = _instrument(statements)
+    define = ast.AsyncFunctionDef if mode else ast.FunctionDef
+    template = define(
+        lineno=1, col_offset=0,
+        name='_bm_template',
+        args=sig,
+        body=statements,
+        decorator_list=[],
+        returns=None)
+
+    # all other names are free variables, i.e. parameters of an outer
+    # function:
+    loads = set()
+    stores = set(names)
+    for node in ast.walk(template):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loads.add(node.id)
+            else:
+                stores.add(node.id)
+    outer = ast.FunctionDef(
+        lineno=1, col_offset=0,
+        name='_bm_outer',
+        args=compat.ast_arguments(
+            args=[compat.ast_arg(arg=name, annotation=None,
+                                 lineno=1, col_offset=0)
+                  for name in sorted(loads - stores)],
+            vararg=None,
+            kwonlyargs=[],
+            kwarg=None,
+            defaults=[],
+            kw_defaults=[]),
+        body=[template,
+              ast.Return(value=ast.Name(id='_bm_template', ctx=ast.Load(),
+                                        lineno=1, col_offset=0),
+                         lineno=1, col_offset=0)],
+        decorator_list=[],
+        returns=None)
+    module = compat.ast_module([outer])
+    return _nested_code(compile(module, astorator._filename, 'exec'))
+
+
+def _instrument(statements):
+    """
+    Return statements that execute ``statements`` and record call
+    statistics.
+
+    Uses the variables provided by :func:`black_magic.stats._namespace`.
+    """
+    import ast
+    module = ast.parse(
+        "_start = _clock()\n"
+        "try:\n"
+        "    pass\n"
+        "finally:\n"
+        "    _start = _clock() - _start\n"
+        "    _stats[0] += 1\n"
+        "    _stats[1] += _start\n"
+        "    _stats[_bisect(_bounds, _start) + 2] += 1\n")
+    module.body[1].body = statements
+    return module.body
+
+
+def _identity_layout(kinds):
+    """Return the call layout that passes on all parameters unchanged."""
+    Parameter = compat.Parameter
+    args = []
+    keywords = []
+    for index, kind in enumerate(kinds):
+        if kind in (Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD):
+            args.append(index)
+        elif kind == Parameter.VAR_POSITIONAL:
+            args.append(('*', index))
+        elif kind == Parameter.KEYWORD_ONLY:
+            keywords.append((index, index))
+        elif kind == Parameter.VAR_KEYWORD:
+            keywords.append((None, index))
+    return (tuple(args), tuple(keywords))
+
+
+def _layout_call(func, layout, names):
+    """
+    Create the AST for a call described by a layout.
+
+    The layout is a tuple ``(args, keywords)``. Each item of ``args`` is
+    either the index of the parameter to be passed, a tuple ``('*', index)``
+    to unpack a parameter or ``None`` for a constant slot. The ``keywords``
+    are pairs ``(keyword, item)``: ``keyword`` can be a parameter index to
+    use its name, a literal name or ``None`` for ``**item``, ``item`` is a
+    parameter index or ``None`` for a constant slot. Constant slots are
+    the names ``_bm_c0, _bm_c1, ...`` in order of appearance.
+    """
+    import ast
+    consts = []
+    def value(item):
+        if item is None:
+            item = '_bm_c%d' % len(consts)
+            consts.append(item)
+        else:
+            item = names[item]
+        return ast.Name(id=item, ctx=ast.Load(), lineno=1, col_offset=0)
+
+    args, keywords = layout
+    call = ast.Call(
+        lineno=1, col_offset=0,
+        func=func,
+        args=[],
+        keywords=[],
+        starargs=None,
+        kwargs=None)
+    for item in args:
+        if isinstance(item, tuple):
+            compat.ast_call_unpack_stararg(call, value(item[1]))
+        else:
+            call.args.append(value(item))
+    for keyword, item in keywords:
+        if keyword is None:
+            compat.ast_call_unpack_kwarg(call, value(item))
+        else:
+            if not isinstance(keyword, str):
+                keyword = names[keyword]
+            call.keywords.append(ast.keyword(
+                lineno=1, col_offset=0,
+                arg=keyword,
+                value=value(item)))
+    return call
+
+
+def _bound_call(func, body, kinds, names):
+    """
+    Create the AST to call ``func`` with the bound arguments of a wrapper.
+
+    For ``'boundargs'`` this is ``func(_bound((_bm_c0, {name: name})))``
+    with a constant slot for the parameter layout, for ``'boundargspec'``
+    it is ``func(_bound(((args...), varargs, {kwonly: kwonly}, varkw)))``.
+    """
+    import ast
+    Parameter = compat.Parameter
+    def load(name):
+        return ast.Name(id=name, ctx=ast.Load(), lineno=1, col_offset=0)
+    def const(value):
+        return ast.Constant(value=value, lineno=1, col_offset=0)
+    def dict_(keys, values):
+        return ast.Dict(keys=keys, values=values, lineno=1, col_offset=0)
+    def tuple_(elts):
+        return ast.Tuple(elts=elts, ctx=ast.Load(), lineno=1, col_offset=0)
+
+    if body == 'boundargs':
+        data = tuple_([
+            load('_bm_c0'),
+            dict_([const(name) for name in names],
+                  [load(name) for name in names]),
+        ])
+    else:
+        positional = [n for n, k in zip(names, kinds)
+                      if k in (Parameter.POSITIONAL_ONLY,
+                               Parameter.POSITIONAL_OR_KEYWORD)]
+        keyword = [n for n, k in zip(names, kinds)
+                   if k == Parameter.KEYWORD_ONLY]
+        var_pos = [n for n, k in zip(names, kinds)
+                   if k == Parameter.VAR_POSITIONAL]
+        var_kw = [n for n, k in zip(names, kinds)
+                  if k == Parameter.VAR_KEYWORD]
+        data = tuple_([
+            tuple_([load(name) for name in positional]),
+            load(var_pos[0]) if var_pos else tuple_([]),
+            dict_([const(name) for name in keyword],
+                  [load(name) for name in keyword]),
+            load(var_kw[0]) if var_kw else dict_([], []),
+        ])
+    bound = ast.Call(lineno=1, col_offset=0, func=load('_bound'),
+                     args=[data], keywords=[], starargs=None, kwargs=None)
+    return ast.Call(lineno=1, col_offset=0, func=func,
+                    args=[bound], keywords=[], starargs=None, kwargs=None)
+
+
+def _replace_const(const, replace):
+    """Replace names in a code constant."""
+    if isinstance(const, str):
+        return replace.get(const, const)
+    if isinstance(const, tuple):
+        return tuple(_replace_const(c, replace) for c in const)
+    return const
+
+
+def wraps(function=None, wrapper=None, signature=None, lazy=False):
     """
     Wrap a function and copy its signature.
 
+    With ``lazy=True`` the code of the wrapper is generated only when it
+    is called for the first time, see :meth:`ASTorator.decorate_lazy`.
+
     WARNING: do not use ``functools.partial``s with this function!
 
     >>> def add(a, b=0):
@@ -289,21 +1219,30 @@ def wraps(function=None, wrapper=None, signature=None):
     # defer creation of the actual function wrapper until called again
     # (this is for use as a decorator)
     if function is not None:
-        decorator = ASTorator.from_function(function, signature=signature)
+        decorator = None
+        if lazy and signature is None:
+            decorator = _code_decorator(function)
+        if decorator is None:
+            decorator = ASTorator.from_function(function, signature=signature)
+        decorate = decorator.decorate_lazy if lazy else decorator.decorate
         if wrapper is None:
-            return decorator.decorate
+            return decorate
         else:
-            return decorator.decorate(wrapper)
+            return decorate(wrapper)
     elif wrapper is not None:
-        return lambda function, signature=signature: wraps(function, wrapper, signature)
+        return lambda function, signature=signature: wraps(function, wrapper,
+                                                           signature, lazy)
     else:
         raise TypeError("Missing argument.")
 
 
-def decorator(decorator):
+def decorator(decorator, lazy=False):
     """
     Create signature preserving function decorators.
 
+    Pass ``lazy=True`` to defer code generation for the decorated
+    functions until they are called, see :func:`wraps`.
+
     >>> @decorator
     ... def plus_one(fn):
     ...     def fake(*args, **kwargs):
@@ -319,13 +1258,18 @@ def decorator(decorator):
     """
     @wraps(decorator)
     def decorate(function):
-        return wraps(function, decorator(function))
+        return wraps(function, decorator(function), lazy=lazy)
+    if not lazy:
+        _register_decorator(decorate, lambda fn: (decorator(fn), ()))
     return decorate
 
-def flatorator(flatorator):
+def flatorator(flatorator, lazy=False):
     """
     Create flat signature preserving decorators.
 
+    Pass ``lazy=True`` to defer code generation for the decorated
+    functions until they are called, see :func:`wraps`.
+
     >>> @flatorator
     ... def times_two(fn, *args, **kwargs):
     ...     return 2 * fn(*args, **kwargs)
@@ -336,31 +1280,102 @@ def flatorator(flatorator):
 
     >>> add_times_two(1, 2)
     6
+
+    The generated wrapper calls the flat decorator directly, i.e. there is
+    no intermediate function between them.
     """
     def decorator(fn):
-        @wraps(fn)
-        def wrapper(*args, **kwargs):
-            return flatorator(fn, *args, **kwargs)
-        return wrapper
+        if lazy:
+            decorator = _code_decorator(fn) or ASTorator.from_function(fn)
+            return decorator.decorate_lazy(flatorator, (fn,))
+        decorator = ASTorator.from_function(fn)
+        return decorator.decorate_with_args(flatorator, fn)
+    if not lazy:
+        _register_decorator(decorator, lambda fn: (flatorator, (fn,)))
     return decorator
 
 
+# decorators created by decorator() or flatorator() -> function that
+# returns ``(callback, args)`` for the wrapper of a given function:
+_decorators = None
+
+
+def _register_decorator(func, entry):
+    global _decorators
+    if _decorators is None:
+        import weakref
+        _decorators = weakref.WeakKeyDictionary()
+    _decorators[func] = entry
+
+
+def _decorator_target(func):
+    """
+    Return a function that returns ``(callback, args)`` for the wrapper
+    that ``func`` would create for a given function, if ``func`` was
+    created by :func:`decorator` or :func:`flatorator`.
+    """
+    if _decorators is None or type(func) is not types.FunctionType:
+        return None
+    return _decorators.get(func)
+
+
 class Value(object):
 
-    """Always return a constant value."""
+    """
+    Always return a constant value.
+
+    Subclasses can override :meth:`ast` to generate a custom expression.
+    """
 
     def __init__(self, value):
         self.value = value
 
     def ast(self, value_name):
+        """
+        Return the expression for the wrapper body.
+
+        The value is available as the global ``value_name``. For immutable
+        values (see :func:`_is_const`) the default expression is a
+        placeholder that is replaced by the value itself after compilation,
+        i.e. the value becomes a constant of the code.
+        """
+        import ast
+        if _is_const(self.value):
+            return ast.Constant(value=_CONST, lineno=1, col_offset=0)
         return ast.Name(id=value_name, ctx=ast.Load(),
                         lineno=1, col_offset=0)
 
 
+def _forward_args(params):
+    """
+    Return the source of the arguments that pass on the given parameters.
+
+    ``params`` are ``(name, kind)`` pairs. The result is a list such as
+    ``['a', '*args', 'b=b', '**kwargs']`` for the expressions generated by
+    subclasses of :class:`Value`.
+    """
+    Parameter = compat.Parameter
+    args = []
+    for name, kind in params:
+        if kind == Parameter.VAR_POSITIONAL:
+            args.append('*' + name)
+        elif kind == Parameter.KEYWORD_ONLY:
+            args.append('%s=%s' % (name, name))
+        elif kind == Parameter.VAR_KEYWORD:
+            args.append('**' + name)
+        else:
+            args.append(name)
+    return args
+
+
 def value(val):
     """
     Return a 'callback' value for use with decorate.
 
+    Any object can be used. Immutable values of builtin types (numbers,
+    strings, tuples of them, ...) become constants of the code of the
+    wrapper, other objects are returned from a closure cell.
+
     Example:
 
     >>> def real(a, b = 1, *args, **kwargs):
@@ -372,72 +1387,155 @@ def value(val):
     >>> fake = wraps(real)(value("Hello world!"))
     >>> fake(a=0)
     'Hello world!'
+    >>> 'Hello world!' in fake.__code__.co_consts
+    True
 
     >>> x = []
     >>> fake = wraps(real)(value(x))
     >>> assert fake(0) is x
     """
-    t = type(val)
-    if t is int or t is float:
-        return ast.Num(n=val, lineno=1, col_offset=0)
-    elif t is str:
-        return ast.Str(s=val, lineno=1, col_offset=0)
-    elif t is bytes:
-        return ast.Bytes(s=val, lineno=1, col_offset=0)
-    else:
-        return Value(val)
+    return Value(val)
+
+
+class BoundArguments(tuple):
+
+    """
+    Arguments passed by :meth:`ASTorator.decorate_with_boundargs`.
+
+    A lightweight replacement for ``inspect.BoundArguments``: the mapping
+    ``arguments`` contains a value for each parameter, including omitted
+    defaults and empty variable length parameters. ``args`` and ``kwargs``
+    are computed on access.
+
+    Instances are created as ``BoundArguments((layout, arguments))`` where
+    layout is the tuple ``(signature, positional, var_pos, keyword_only,
+    var_kw)`` of parameter names. Creating them does not involve any python
+    level function call.
+    """
+
+    __slots__ = ()
+
+    _layout = property(operator.itemgetter(0))
+    arguments = property(operator.itemgetter(1))
+
+    @property
+    def signature(self):
+        return self._layout[0]
+
+    @property
+    def args(self):
+        _, positional, var_pos, _, _ = self._layout
+        arguments = self.arguments
+        args = tuple(arguments[name] for name in positional)
+        if var_pos is not None:
+            args += tuple(arguments[var_pos])
+        return args
+
+    @property
+    def kwargs(self):
+        _, _, _, keyword, var_kw = self._layout
+        arguments = self.arguments
+        kwargs = dict((name, arguments[name]) for name in keyword)
+        if var_kw is not None:
+            kwargs.update(arguments[var_kw])
+        return kwargs
+
+    def argspec(self):
+        """Return the same arguments as :class:`BoundArgSpec`."""
+        _, positional, var_pos, keyword, var_kw = self._layout
+        arguments = self.arguments
+        return BoundArgSpec((
+            tuple(arguments[name] for name in positional),
+            arguments[var_pos] if var_pos is not None else (),
+            dict((name, arguments[name]) for name in keyword),
+            arguments[var_kw] if var_kw is not None else {}))
+
+    def __repr__(self):
+        return '<BoundArguments (%s)>' % ', '.join(
+            '%s=%r' % item for item in self.arguments.items())
+
+
+class BoundArgSpec(tuple):
+
+    """
+    Arguments passed by :meth:`ASTorator.decorate_with_boundargspec`.
+
+    The tuple ``(args, varargs, kwonlyargs, varkw)`` holds the values of
+    the positional parameters, the variable positional arguments, a dict
+    of the keyword-only parameters and a dict of the variable keyword
+    arguments, i.e. the values corresponding to the fields of
+    ``inspect.getfullargspec``.
+    """
+
+    __slots__ = ()
+
+    args = property(operator.itemgetter(0))
+    varargs = property(operator.itemgetter(1))
+    kwonlyargs = property(operator.itemgetter(2))
+    varkw = property(operator.itemgetter(3))
 
+    def __repr__(self):
+        return 'BoundArgSpec(args=%r, varargs=%r, kwonlyargs=%r, varkw=%r)' % (
+            self)
 
 
 class _ParameterBinding(object):
 
-    """Custom parameter binding algorithm."""
+    """
+    Custom parameter binding algorithm.
+
+    The parameter layout is computed once per signature and shared with
+    all bindings derived from it. Bound parameters are tracked as bits of
+    an integer mask indexed by parameter position.
+    """
+
+    __slots__ = ('_parameters', '_index', '_num_pos', '_var_pos', '_var_kw',
+                 '_bound', 'args', 'kwargs')
 
     def __init__(self,
-                 parameters,
-                 pos, kw,
+                 parameters, index, num_pos,
                  var_pos, var_kw,
-                 bound_args, bound_kwargs):
+                 bound, bound_args, bound_kwargs):
         self._parameters = parameters
-        self._pos = pos
-        self._kw = kw
+        self._index = index
+        self._num_pos = num_pos
         self._var_pos = var_pos
         self._var_kw = var_kw
+        self._bound = bound
         self.args = bound_args
         self.kwargs = bound_kwargs
 
     @classmethod
     def from_signature(cls, signature):
         parameters = list(signature.parameters.values())
-        pos = []
-        kw = {}
+        index = {}
+        num_pos = 0
         var_pos = None
         var_kw = None
         for i,par in enumerate(parameters):
             if par.kind in (par.POSITIONAL_OR_KEYWORD, par.POSITIONAL_ONLY):
-                pos.append(i)
+                num_pos += 1
             if par.kind in (par.POSITIONAL_OR_KEYWORD, par.KEYWORD_ONLY):
-                kw[par.name] = i
+                index[par.name] = i
             if par.kind == par.VAR_POSITIONAL:
                 var_pos = par
             if par.kind == par.VAR_KEYWORD:
                 var_kw = par
-        return cls(parameters, pos, kw, var_pos, var_kw,
-                   [parameters[i].default for i in pos],
+        return cls(parameters, index, num_pos, var_pos, var_kw, 0,
+                   [p.default for p in parameters[:num_pos]],
                    dict((p.name,p.default) for p in parameters
                         if p.kind == p.KEYWORD_ONLY and p.default is not p.empty))
 
     def bind(self, *args, **kwargs):
-        pos = list(self._pos)
-        kw = dict(self._kw.items())
+        num_pos = self._num_pos
+        bound = self._bound
         bound_args = list(self.args)
-        bound_kwargs = dict(self.kwargs.items())
+        bound_kwargs = self.kwargs.copy() if kwargs else self.kwargs
 
         # bind **kwargs:
         for key,val in kwargs.items():
-            try:
-                index = kw.pop(key)
-            except KeyError:          # var_kw
+            index = self._index.get(key)
+            if index is None or bound >> index & 1:     # var_kw
                 if self._var_kw is None:
                     raise TypeError(
                         "Got an unexpected keyword argument '%s'"
@@ -448,44 +1546,59 @@ class _ParameterBinding(object):
                         % (key,))
                 bound_kwargs[key] = val
             else:
-                try:
-                    pos.remove(index)
-                except ValueError:
-                    bound_kwargs[key] = val
-                else:
+                bound |= 1 << index
+                if index < num_pos:
                     bound_args[index] = val
+                else:
+                    bound_kwargs[key] = val
 
         # bind *args:
-        for index,val in zip(pos, args):
-            bound_args[index] = val
-            kw.pop(self._parameters[index].name, None)
-        num_args = min(len(pos), len(args))
-        pos = pos[num_args:]
-        args = args[num_args:]
-        if args:
+        num_args = len(args)
+        if not bound & ((1 << num_pos) - 1):
+            # fast path: no positional parameter has been bound yet
+            num_bound = min(num_pos, num_args)
+            bound_args[:num_bound] = args[:num_bound]
+            bound |= (1 << num_bound) - 1
+        else:
+            # iterate over the unset bits, lowest first:
+            free = ~bound & ((1 << num_pos) - 1)
+            num_bound = 0
+            while free and num_bound < num_args:
+                bit = free & -free
+                free ^= bit
+                bound_args[bit.bit_length() - 1] = args[num_bound]
+                num_bound += 1
+            bound |= ~free & ((1 << num_pos) - 1)
+        if num_bound < num_args:
             if self._var_pos is None:
                 raise TypeError(
-                    "%Got too many positional arguments.")
-            bound_args += list(args)
+                    "Got too many positional arguments.")
+            bound_args.extend(args[num_bound:])
 
         return _ParameterBinding(
-            self._parameters,
-            pos, kw,
+            self._parameters, self._index, num_pos,
             self._var_pos, self._var_kw,
-            bound_args, bound_kwargs)
+            bound, bound_args, bound_kwargs)
+
+    def is_bound(self, index):
+        """Check whether the parameter at ``index`` has been bound."""
+        return bool(self._bound >> index & 1)
 
     def finalize(self):
-        if self._kw:
+        unbound = [p for p in self.free_parameters
+                   if p is not self._var_pos and p is not self._var_kw]
+        named = [p.name for p in unbound if p.name in self._index]
+        if named:
             raise TypeError("Unresolved keyword parameter(s): " +
-                            ", ".join(self._kw))
-        if self._pos:
+                            ", ".join(named))
+        if unbound:
             raise TypeError("Not enough parameters...")
 
     @property
     def free_parameters(self):
+        bound = self._bound
         return [p for i,p in enumerate(self._parameters)
-                if (i in self._pos or p.name in self._kw or
-                    p is self._var_pos or p is self._var_kw)]
+                if not bound >> i & 1]
 
 
 def metapartial(*args, **kwargs):
@@ -504,9 +1617,13 @@ def metapartial(*args, **kwargs):
     ...     return (a, b, args, kwargs)
     >>> func(2)
     (0, 1, (2,), {'c': 3})
+
+    The binding is computed only once for functions with the same
+    parameter names and kinds, see :func:`_partial`.
     """
 
     _args, _kwargs = args, kwargs
+    plans = common.LRUCache(maxsize=64)
 
     def partial(*args, **kwargs):
         """
@@ -563,7 +1680,9 @@ def metapartial(*args, **kwargs):
         kw = _merge_kwargs(_kwargs, kwargs)
         if not args or args[0] is None:
             return metapartial(*pos, **kw)
-        return _partial(args[0], pos, kw)
+        if len(args) > 1 or kwargs:
+            return _partial(args[0], pos, kw)
+        return _partial(args[0], pos, kw, plans)
 
     return partial
 
@@ -581,28 +1700,270 @@ def _merge_kwargs(a, b):
     return kw
 
 
-def _partial(func, args, kwargs):
-    """Create the partial for func(*args, **kwargs, ...)."""
+def _partial(func, args, kwargs, plans=None):
+    """
+    Create the partial for func(*args, **kwargs, ...).
+
+    ``plans`` caches the parameter binding for ``args`` and ``kwargs`` by
+    signature shape, i.e. it must only be passed with the same arguments.
+    """
     # Unwrap functools.partial functions, these are pure evil :(except for
     # their nice performance:)!
-    if isinstance(func, functools.partial):
-        pos = func.args + args
-        kw = _merge_kwargs(func.keywords, kwargs)
-        func = partial(func.func, *pos, **kw)
+    if isinstance(func, compat.functools_partial):
+        args = func.args + args
+        kwargs = _merge_kwargs(func.keywords, kwargs)
+        func = func.func
+        plans = None
+    wrapped = func
 
     # NOTE: we can't just use functools.partial/sig.bind_partial to create
     # the underlying wrapper function/argument binding, because it behaves
     # differently for positional arguments when specifying parameters by
     # keyword. (TypeError: multiple values for argument 'xxx')
 
-    sig = compat.signature(func)
-    par_binding = _ParameterBinding.from_signature(sig).bind(*args, **kwargs)
+    # Partials of our own partials continue the binding of the original
+    # function, so that there is only a single wrapper:
+    target = _partial_target(func)
+    shape = None
+    if target is None:
+        if plans is not None:
+            shape = _code_shape(func)
+        if shape is not None:
+            plan = plans.get(shape)
+            if plan is not None:
+                return _partial_from_plan(func, plan, (args, kwargs))
+        sig = ASTorator.signature_cache(func)
+        par_binding = _ParameterBinding.from_signature(sig)
+    else:
+        func, par_binding = target
+        sig = ASTorator.signature_cache(func)
+    par_binding = par_binding.bind(*args, **kwargs)
     new_sig = sig.replace(parameters=par_binding.free_parameters)
 
-    def wrapper(*call_args, **call_kwargs):
-        call_binding = par_binding.bind(*call_args, **call_kwargs)
-        call_binding.finalize()
-        return func(*call_binding.args, **call_binding.kwargs)
+    # Generate a function that passes the bound values as constants:
+    decorator = ASTorator.from_function(wrapped, signature=new_sig)
+    if decorator._kinds is not None:
+        layout, consts = _partial_layout(par_binding)
+        result = decorator._update(
+            decorator._instanciate(func, layout, consts))
+        if shape is not None:
+            plans[shape] = _partial_plan(func, decorator, par_binding,
+                                         layout, consts)
+    else:
+        def wrapper(*call_args, **call_kwargs):
+            call_binding = par_binding.bind(*call_args, **call_kwargs)
+            call_binding.finalize()
+            return func(*call_binding.args, **call_binding.kwargs)
+        result = decorator.decorate(wrapper)
 
-    return wraps(func, wrapper, signature=new_sig)
+    _register_partial(result, (func, par_binding, result.__code__))
+    return result
 
+
+def _code_shape(func):
+    """
+    Return the parameter names and kinds of a plain python function.
+
+    The shape is read from the code object without computing the
+    signature. Returns ``None`` for other callables and for functions with
+    ``__signature__`` or ``__wrapped__``.
+    """
+    if type(func) is not types.FunctionType:
+        return None
+    extra = func.__dict__
+    if '__signature__' in extra or '__wrapped__' in extra:
+        return None
+    code = func.__code__
+    flags = code.co_flags & (_CO_VARARGS | _CO_VARKEYWORDS)
+    num = (code.co_argcount + code.co_kwonlyargcount +
+           bool(flags & _CO_VARARGS) + bool(flags & _CO_VARKEYWORDS))
+    return (code.co_varnames[:num], code.co_argcount,
+            getattr(code, 'co_posonlyargcount', 0),
+            code.co_kwonlyargcount, flags)
+
+
+_CO_VARARGS = 0x04
+_CO_VARKEYWORDS = 0x08
+
+
+def _code_decorator(function):
+    """
+    Create an :class:`ASTorator` for a plain function from its code object
+    and defaults, without computing its signature.
+
+    The signature is computed on first access, i.e. only when the AST
+    backend is needed. Returns ``None`` for callables that are not
+    supported by :func:`_code_shape`.
+    """
+    shape = _code_shape(function)
+    if shape is None:
+        return None
+    varnames, argcount, posonlyargcount, kwonlyargcount, flags = shape
+    Parameter = compat.Parameter
+    kinds = ([int(Parameter.POSITIONAL_ONLY)] * posonlyargcount +
+             [int(Parameter.POSITIONAL_OR_KEYWORD)] *
+             (argcount - posonlyargcount))
+    if flags & _CO_VARARGS:
+        kinds.append(int(Parameter.VAR_POSITIONAL))
+    kinds.extend([int(Parameter.KEYWORD_ONLY)] * kwonlyargcount)
+    if flags & _CO_VARKEYWORDS:
+        kinds.append(int(Parameter.VAR_KEYWORD))
+
+    decorator = ASTorator.__new__(ASTorator)
+    decorator._function = function
+    (decorator.funcname, decorator.filename,
+     decorator.assign, decorator.update) = _function_info(function)
+    decorator._kinds = tuple(kinds)
+    decorator._call_layout = _identity_layout(kinds)
+    # the code object has the same order as ASTorator._varnames:
+    decorator._varnames = varnames
+    decorator._defaults = function.__defaults__
+    decorator._kwdefaults = dict(function.__kwdefaults__ or ()) or None
+    decorator._annotations = dict(function.__annotations__)
+    decorator._filename = '<wraps(%s:%s)>' % (decorator.filename or '?',
+                                             decorator.funcname)
+    decorator._shape = None
+    decorator._async = _async_kind(function)
+    return decorator
+
+
+def _partial_plan(func, decorator, par_binding, layout, consts):
+    """
+    Return the plan to create partials for functions of the same shape.
+
+    The plan consists of the code positions of the free positional
+    parameters, the names of the free parameters, the call layout, the
+    constants and the attributes of the ``decorator`` that only depend on
+    the shape.
+    """
+    code = func.__code__
+    free = [param.name for param in par_binding.free_parameters]
+    positions = tuple(i for i, name in
+                      enumerate(code.co_varnames[:code.co_argcount])
+                      if name in free)
+    state = dict((attr, getattr(decorator, attr))
+                 for attr in ('_kinds', '_call_layout', '_varnames'))
+    return (positions, tuple(free), layout, consts, state)
+
+
+def _partial_from_plan(func, plan, arguments):
+    """
+    Create a partial from a plan cached by :func:`metapartial`.
+
+    The defaults and annotations of the free parameters are taken from
+    ``func``, the signature is not computed.
+    """
+    positions, free, layout, consts, state = plan
+    decorator = _shape_decorator(func, state, positions, free)
+    result = decorator._update(decorator._instanciate(func, layout, consts))
+    _register_partial(result, (func, arguments, result.__code__))
+    return result
+
+
+def _shape_decorator(func, state, positions, free):
+    """
+    Create an :class:`ASTorator` for a plain function without computing
+    its signature.
+
+    ``state`` holds the attributes that only depend on the shape of the
+    wrapper (as computed for another function of the same shape, see
+    :func:`_code_shape`). The wrapper has the parameters ``free``, its
+    positional parameters are at ``positions`` in the code of ``func``.
+    The defaults and annotations are taken from ``func``.
+    """
+    defaults = func.__defaults__ or ()
+    kwdefaults = func.__kwdefaults__ or {}
+    annotations = func.__annotations__
+    offset = func.__code__.co_argcount - len(defaults)
+
+    decorator = ASTorator.__new__(ASTorator)
+    decorator.__dict__.update(state)
+    decorator.signature = None      # not needed by _instanciate
+    (decorator.funcname, decorator.filename,
+     decorator.assign, decorator.update) = _function_info(func)
+    decorator._defaults = tuple(defaults[i - offset] for i in positions
+                                if i >= offset) or None
+    decorator._kwdefaults = dict((name, kwdefaults[name]) for name in free
+                                 if name in kwdefaults) or None
+    decorator._annotations = dict((name, annotations[name])
+                                  for name in free + ('return',)
+                                  if name in annotations)
+    decorator._filename = '<wraps(%s:%s)>' % (decorator.filename or '?',
+                                             decorator.funcname)
+    decorator._shape = None
+    decorator._async = _async_kind(func)
+    return decorator
+
+
+# partial -> (original function, binding or (args, kwargs), code of the
+# partial):
+_partials = None
+
+
+def _register_partial(func, entry):
+    global _partials
+    if _partials is None:
+        import weakref
+        _partials = weakref.WeakKeyDictionary()
+    _partials[func] = entry
+
+
+def _partial_target(func):
+    """Return ``(func, binding)`` if ``func`` was created by partial."""
+    if _partials is None or type(func) is not types.FunctionType:
+        return None
+    entry = _partials.get(func)
+    if entry is None or entry[2] is not func.__code__:
+        return None
+    func, binding = entry[:2]
+    if type(binding) is tuple:
+        args, kwargs = binding
+        binding = _ParameterBinding.from_signature(
+            ASTorator.signature_cache(func)).bind(*args, **kwargs)
+    return func, binding
+
+
+def _partial_layout(par_binding):
+    """
+    Return the call layout and constants for a partial.
+
+    Free parameters are passed through by position or name, bound values
+    are inserted as constants. Bound keyword-only values are passed in the
+    constant ``**`` dict: literal keyword names in the template would be
+    renamed along with the canonical parameter names, see
+    :meth:`ASTorator._specialize`.
+    """
+    free = dict((param.name, index) for index, param
+                in enumerate(par_binding.free_parameters))
+    parameters = par_binding._parameters
+    args = []
+    keywords = []
+    consts = []
+
+    for index, value in enumerate(par_binding.args):
+        if index < par_binding._num_pos and not par_binding.is_bound(index):
+            args.append(free[parameters[index].name])
+        else:
+            args.append(None)
+            consts.append(value)
+    if par_binding._var_pos is not None:
+        args.append(('*', free[par_binding._var_pos.name]))
+
+    var_kwargs = par_binding.kwargs.copy()
+    for param in parameters:
+        if param.kind == param.KEYWORD_ONLY:
+            if param.name in free:
+                var_kwargs.pop(param.name, None)
+                keywords.append((free[param.name], free[param.name]))
+    if var_kwargs:
+        keywords.append((None, None))
+        consts.append(var_kwargs)
+    if par_binding._var_kw is not None:
+        keywords.append((None, free[par_binding._var_kw.name]))
+
+    return (tuple(args), tuple(keywords)), consts
+
+
+if os.environ.get('BLACK_MAGIC_CACHE_DIR'):
+    from . import diskcache
+    diskcache.enable(os.environ['BLACK_MAGIC_CACHE_DIR'])
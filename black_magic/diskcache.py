@@ -0,0 +1,161 @@
+"""
+Persistent cache for the code generated by black_magic.decorator.
+
+The cache is opt-in. Enable it by calling :func:`enable` or by setting the
+environment variable ``BLACK_MAGIC_CACHE_DIR`` before importing
+``black_magic.decorator``.
+"""
+
+from __future__ import absolute_import
+
+
+__all__ = [
+    'DiskCache',
+    'enable',
+    'disable',
+]
+
+
+import os
+import marshal
+import hashlib
+import tempfile
+
+from importlib.util import MAGIC_NUMBER
+
+from . import __version__
+
+
+class DiskCache(object):
+
+    """
+    Directory of marshalled code objects.
+
+    Each entry is stored in a file whose name is derived from the python
+    magic number and a hash of the key. Files are written atomically by
+    renaming a temporary file, so that concurrent writers and readers in
+    different processes never see partial entries. If the total size of
+    the entries exceeds ``maxsize`` bytes, the oldest entries are removed.
+    Any error while reading or writing is treated like a cache miss.
+    """
+
+    suffix = '.bmc'
+
+    def __init__(self, path, maxsize=16*1024*1024):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    def _filename(self, key):
+        digest = hashlib.sha1(self._header(key)).hexdigest()
+        return os.path.join(self.path, '%s-%s%s' % (
+            MAGIC_NUMBER.hex(), digest, self.suffix))
+
+    def _header(self, key):
+        return ('%s\n%r\n' % (__version__, key)).encode('utf-8')
+
+    def get(self, key, default=None):
+        """Load the code object for ``key``."""
+        header = self._header(key)
+        try:
+            with open(self._filename(key), 'rb') as f:
+                data = f.read()
+            if not data.startswith(MAGIC_NUMBER + header):
+                raise ValueError("Corrupt or foreign cache entry")
+            value = marshal.loads(data[len(MAGIC_NUMBER + header):])
+        except (IOError, OSError, ValueError, EOFError, TypeError):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        """Store the code object for ``key``."""
+        data = MAGIC_NUMBER + self._header(key) + marshal.dumps(value)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, self._filename(key))
+            except BaseException:
+                os.remove(tmp)
+                raise
+        except (IOError, OSError):
+            return
+        if self._size is not None:
+            self._size += len(data)
+        if self.size() > self.maxsize:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self):
+        """Return the (approximate) total size of all entries in bytes."""
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def evict(self, fraction=0.75):
+        """Remove the oldest entries until the size is below the limit."""
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        limit = self.maxsize * fraction
+        for _, entry_size, path in entries:
+            if size <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+        self._size = size
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+
+def enable(path=None, maxsize=16*1024*1024):
+    """
+    Use a persistent cache for generated code.
+
+    The default location is ``~/.cache/black_magic``.
+    """
+    from .decorator import ASTorator
+    if path is None:
+        path = os.path.join(os.path.expanduser('~'), '.cache', 'black_magic')
+    ASTorator.disk_cache = DiskCache(path, maxsize=maxsize)
+    return ASTorator.disk_cache
+
+
+def disable():
+    """Stop using the persistent cache."""
+    from .decorator import ASTorator
+    ASTorator.disk_cache = None
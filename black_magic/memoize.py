@@ -0,0 +1,275 @@
+"""
+Memoization by the canonical arguments of a call.
+
+In contrast to ``functools.lru_cache`` the cache key does not depend on
+how the arguments are passed. The memoized function has the signature of
+the original function and builds the key directly from its parameters,
+i.e. omitted defaults are filled in and keyword arguments are matched to
+their parameters:
+
+>>> @memoize
+... def add(a, b=2):
+...     print('computing')
+...     return a + b
+>>> add(1, b=2)
+computing
+3
+>>> add(1, 2), add(1), add(b=2, a=1)
+(3, 3, 3)
+>>> add.cache_info()
+CacheInfo(hits=3, misses=1, maxsize=128, currsize=1)
+"""
+
+from __future__ import absolute_import
+
+
+__all__ = [
+    'memoize',
+]
+
+
+import sys
+from timeit import default_timer
+
+from . import common
+from . import compat
+from .decorator import ASTorator, Value, _async_kind, _forward_args
+
+
+def memoize(func=None, maxsize=128, policy='lru', ttl=None, maxbytes=None,
+            sizeof=sys.getsizeof, exclude=(), timer=default_timer):
+    """
+    Cache the results of ``func`` by its canonical arguments.
+
+    Can be used as ``@memoize`` or with options ``@memoize(maxsize=...)``.
+
+    ``maxsize`` limits the number of cached results, ``maxbytes`` their
+    total size as computed by ``sizeof(result)`` (``None`` for no limit).
+    When a limit is exceeded, the least recently used (``policy='lru'``)
+    or least frequently used (``policy='lfu'``, ties are broken by age)
+    result is discarded. With ``ttl``, results expire after ``ttl``
+    seconds as measured by ``timer``.
+
+    The parameters named in ``exclude`` are not part of the cache key,
+    i.e. calls that differ only in these arguments share their result.
+
+    The memoized function has the methods ``cache_info()``, which returns
+    the number of hits and misses, and ``cache_clear()``. Calls with
+    unhashable arguments (including defaults) are passed to ``func``
+    without caching. Coroutine functions are not supported.
+    """
+    if func is None:
+        return lambda func: memoize(func, maxsize, policy, ttl, maxbytes,
+                                    sizeof, exclude, timer)
+    if policy not in _POLICIES:
+        raise ValueError("Unknown policy: %r" % (policy,))
+    if _async_kind(func) is not None:
+        raise TypeError("Can not memoize coroutine functions.")
+
+    decorator = ASTorator.from_function(func)
+    params = decorator.signature.parameters
+    for name in exclude:
+        if name not in params:
+            raise ValueError("No parameter named '%s'." % name)
+    kinds = [(name, param.kind) for name, param in params.items()]
+    keys = [name for name, kind in kinds if name not in exclude]
+    # keyword arguments are collected in a dict, the key needs a frozenset:
+    varkw = any(kind == compat.Parameter.VAR_KEYWORD and name not in exclude
+                for name, kind in kinds)
+
+    cache = _POLICIES[policy](func, maxsize, maxbytes, sizeof, ttl, timer,
+                              varkw)
+    wrapper = decorator.decorate(_KeyedCall(cache.lookup, kinds, keys))
+    wrapper.cache_info = cache.info
+    wrapper.cache_clear = cache.clear
+    return wrapper
+
+
+class _KeyedCall(Value):
+
+    """
+    Call ``value(key, <parameters>)``, where ``key`` is the tuple of the
+    parameters named in ``keys``.
+    """
+
+    def __init__(self, value, kinds, keys):
+        self.value = value
+        self.kinds = kinds
+        self.keys = keys
+
+    def ast(self, value_name):
+        import ast
+        args = _forward_args(self.kinds)
+        key = '(%s)' % ''.join(name + ',' for name in self.keys)
+        source = '%s(%s)' % (value_name, ', '.join([key] + args))
+        return ast.parse(source, mode='eval').body
+
+
+_MISSING = object()
+
+
+class _Cache(object):
+
+    """
+    Storage for the results of a memoized function.
+
+    Entries are ``(result, size, expiry)``. Subclasses implement the
+    eviction policy.
+    """
+
+    def __init__(self, func, maxsize, maxbytes, sizeof, ttl, timer, varkw):
+        self.func = func
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.timer = timer
+        self.varkw = varkw
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = common.OrderedDict()
+        self._lock = common.Lock()
+
+    def lookup(*args, **kwargs):
+        """
+        Return the cached result for ``key`` or call the function.
+
+        Called as ``lookup(key, *args, **kwargs)``. The cache and the key
+        are taken from ``args`` so that they can not collide with keyword
+        arguments of the function.
+        """
+        self, key = args[:2]
+        args = args[2:]
+        try:
+            if self.varkw:
+                key = key[:-1] + (frozenset(key[-1].items()),)
+            hash(key)
+        except TypeError:
+            return self.func(*args, **kwargs)
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and (
+                    entry[2] is None or entry[2] > self.timer()):
+                self.hits += 1
+                self._touch(key)
+                return entry[0]
+            self.misses += 1
+        result = self.func(*args, **kwargs)
+        with self._lock:
+            self._store(key, result)
+        return result
+
+    def _store(self, key, result):
+        data = self._data
+        if key in data:
+            self._delete(key)
+        size = 0
+        if self.maxbytes is not None:
+            size = self.sizeof(result)
+            if size > self.maxbytes:
+                return
+            while self.nbytes + size > self.maxbytes:
+                self._delete(self._victim())
+        if self.maxsize is not None:
+            if self.maxsize <= 0:
+                return
+            while len(data) >= self.maxsize:
+                self._delete(self._victim())
+        expiry = None if self.ttl is None else self.timer() + self.ttl
+        data[key] = (result, size, expiry)
+        self.nbytes += size
+        self._insert(key)
+
+    def _delete(self, key):
+        self.nbytes -= self._data.pop(key)[1]
+        self._remove(key)
+
+    def clear(self):
+        """Remove all results and reset the statistics."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.nbytes = 0
+            self._reset()
+
+    def info(self):
+        """Return a :class:`black_magic.common.CacheInfo`."""
+        with self._lock:
+            return common.CacheInfo(self.hits, self.misses, self.maxsize,
+                                    len(self._data))
+
+
+class _LRUCache(_Cache):
+
+    """Discards the least recently used result first."""
+
+    def _touch(self, key):
+        data = self._data
+        data[key] = data.pop(key)
+
+    def _victim(self):
+        return next(iter(self._data))
+
+    def _insert(self, key):
+        pass
+
+    def _remove(self, key):
+        pass
+
+    def _reset(self):
+        pass
+
+
+class _LFUCache(_Cache):
+
+    """
+    Discards the least frequently used result first.
+
+    Keys are kept in buckets by their number of hits, in order of
+    insertion within a bucket.
+    """
+
+    def __init__(self, *args):
+        _Cache.__init__(self, *args)
+        self._reset()
+
+    def _reset(self):
+        self._counts = {}
+        self._buckets = {}
+        self._min = 0
+
+    def _touch(self, key):
+        count = self._counts[key]
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+            if self._min == count:
+                self._min = count + 1
+        self._counts[key] = count + 1
+        self._buckets.setdefault(count + 1, common.OrderedDict())[key] = None
+
+    def _victim(self):
+        return next(iter(self._buckets[self._min]))
+
+    def _insert(self, key):
+        self._counts[key] = 0
+        self._buckets.setdefault(0, common.OrderedDict())[key] = None
+        self._min = 0
+
+    def _remove(self, key):
+        count = self._counts.pop(key)
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+            if self._min == count and self._buckets:
+                self._min = min(self._buckets)
+
+
+_POLICIES = {
+    'lru': _LRUCache,
+    'lfu': _LFUCache,
+}
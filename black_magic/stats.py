@@ -0,0 +1,115 @@
+"""
+Call statistics for the wrappers generated by black_magic.decorator.
+
+Instrumentation is opt-in. After calling :func:`enable` all wrappers that
+are created by ``wraps``, ``decorator``, ``flatorator``, ``partial`` etc
+count their calls and record the elapsed time of each call into a fixed
+bucket histogram. The bookkeeping is done by the generated code itself,
+there is no additional function layer.
+
+>>> from black_magic.decorator import wraps
+>>> enable()
+>>> def size(obj):
+...     return len(obj)
+>>> size = wraps(size)(size)
+>>> disable()
+>>> size([1, 2])
+2
+>>> get(size).calls
+1
+>>> reset()
+>>> get(size).calls
+0
+
+Counters of wrappers that are called from multiple threads concurrently
+are approximate. Wrappers compiled by the AST backend (for ``ast.expr``
+callbacks or custom ``Value`` expressions) are not instrumented.
+"""
+
+from __future__ import absolute_import
+
+
+__all__ = [
+    'BUCKETS',
+    'CallStats',
+    'enable',
+    'disable',
+    'get',
+    'snapshot',
+    'reset',
+]
+
+
+import bisect
+import weakref
+from collections import namedtuple
+from timeit import default_timer
+
+
+#: Upper bounds of the histogram buckets in seconds. The last bucket
+#: collects all calls that took longer than ``BUCKETS[-1]``.
+BUCKETS = (1e-6, 4e-6, 16e-6, 64e-6, 256e-6,
+           1e-3, 4e-3, 16e-3, 64e-3, 256e-3, 1.0)
+
+CallStats = namedtuple('CallStats', ['calls', 'time', 'histogram'])
+
+# instrumented wrapper -> [calls, time, bucket 0, ..., bucket n]:
+_registry = weakref.WeakKeyDictionary()
+
+
+def enable():
+    """Instrument all subsequently created wrappers."""
+    from .decorator import ASTorator
+    ASTorator.instrument = True
+
+
+def disable():
+    """Stop instrumenting new wrappers (existing ones keep counting)."""
+    from .decorator import ASTorator
+    ASTorator.instrument = False
+
+
+def get(func):
+    """Return the :class:`CallStats` for an instrumented wrapper."""
+    return _snapshot(_registry[func])
+
+
+def snapshot():
+    """Return a dict mapping all instrumented wrappers to their stats."""
+    return dict((func, _snapshot(counters))
+                for func, counters in list(_registry.items()))
+
+
+def reset():
+    """Reset the stats of all instrumented wrappers."""
+    for counters in list(_registry.values()):
+        counters[:] = _counters()
+
+
+def _snapshot(counters):
+    return CallStats(counters[0], counters[1], tuple(counters[2:]))
+
+
+def _counters():
+    return [0, 0.0] + [0] * (len(BUCKETS) + 1)
+
+
+def _namespace():
+    """Return the variables used by the code of an instrumented wrapper."""
+    return {
+        '_stats': _counters(),
+        '_clock': default_timer,
+        '_bisect': bisect.bisect_left,
+        '_bounds': BUCKETS,
+    }
+
+
+def _register(func, namespace):
+    _registry[func] = namespace['_stats']
+
+
+def _move(func, other):
+    """Transfer the stats of ``func`` to ``other``."""
+    counters = _registry.pop(func, None)
+    if counters is not None:
+        _registry[other] = counters
@@ -11,14 +11,6 @@ try:
 except IOError:
     pass
 
-try:
-    from inspect import signature, Signature, Parameter, BoundArguments
-except ImportError:     # python2
-    install_requires = ['funcsigs']
-else:                   # python3
-    install_requires = []
-
-
 def exec_file(path):
     """Execute a python file and return the `globals` dictionary."""
     namespace = {}
@@ -40,7 +32,7 @@ setup(
     url=metadata['__uri__'],
     license=metadata['__license__'],
     packages=['black_magic'],
-    install_requires=install_requires,
+    python_requires='>=3.6',
     classifiers=metadata['__classifiers__'],
     test_suite='nose.collector',
     tests_require='nose',
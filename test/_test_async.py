@@ -0,0 +1,149 @@
+# encoding: utf-8
+"""
+Unit tests for asynchronous wrappers (requires python 3.6).
+"""
+
+import asyncio
+import inspect
+import unittest
+
+from black_magic import stats
+from black_magic.compat import signature
+from black_magic.decorator import (ASTorator, wraps, decorator, flatorator,
+                                   partial, value)
+
+__all__ = [
+    'TestAsync',
+]
+
+
+def run(awaitable):
+    if hasattr(asyncio, 'run'):
+        return asyncio.run(awaitable)
+    # python3.6 has no asyncio.run:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(awaitable)
+    finally:
+        loop.close()
+
+
+async def collect(items):
+    return [item async for item in items]
+
+
+class TestAsync(unittest.TestCase):
+
+    def setUp(self):
+        async def real(a, b=1, *args, **kwargs):
+            return (a, b, args, kwargs)
+        async def agen(a, b=1):
+            for i in range(a):
+                yield i * b
+        self.real = real
+        self.agen = agen
+
+    def test_coroutine_function(self):
+        fake = wraps(self.real)(self.real)
+        self.assertTrue(inspect.iscoroutinefunction(fake))
+        self.assertEqual(signature(fake), signature(self.real))
+        self.assertEqual(run(fake(0, c=2)), (0, 1, (), {'c': 2}))
+
+    def test_async_generator_function(self):
+        fake = wraps(self.agen)(self.agen)
+        self.assertTrue(inspect.isasyncgenfunction(fake))
+        self.assertEqual(run(collect(fake(3, b=2))), [0, 2, 4])
+
+    def test_async_callback(self):
+        """A coroutine callback makes the wrapper asynchronous."""
+        async def flat(fn, *args, **kwargs):
+            return ('flat', fn(*args, **kwargs))
+        def real(a, b=1):
+            return (a, b)
+        fake = flatorator(flat)(real)
+        self.assertTrue(inspect.iscoroutinefunction(fake))
+        self.assertEqual(run(fake(0)), ('flat', (0, 1)))
+
+    def test_sync_callback(self):
+        """The result of a synchronous callback is returned as is."""
+        def flat(fn, *args, **kwargs):
+            return fn(*args, **kwargs)
+        def plus_one(fn):
+            async def wrapper(*args, **kwargs):
+                return 1 + (await fn(*args, **kwargs))[0]
+            return wrapper
+        fake = flatorator(flat)(self.real)
+        self.assertFalse(inspect.iscoroutinefunction(fake))
+        self.assertEqual(run(fake(0)), (0, 1, (), {}))
+        fake = wraps(self.real)(lambda *args, **kwargs: args)
+        self.assertEqual(fake(0), (0, 1))
+        fake = decorator(plus_one)(self.real)
+        self.assertTrue(inspect.iscoroutinefunction(fake))
+        self.assertEqual(run(fake(2)), 3)
+
+    def test_partial(self):
+        fake = partial(self.real, 0, c=2)
+        self.assertTrue(inspect.iscoroutinefunction(fake))
+        self.assertEqual(run(fake(3)), (0, 3, (), {'c': 2}))
+        fake = partial(self.agen, b=3)
+        self.assertTrue(inspect.isasyncgenfunction(fake))
+        self.assertEqual(run(collect(fake(2))), [0, 3])
+
+    def test_lazy(self):
+        lazy = wraps(self.real, self.real, lazy=True)
+        self.assertTrue(inspect.iscoroutinefunction(lazy))
+        self.assertEqual(run(lazy(0, 2)), (0, 2, (), {}))
+        self.assertEqual(run(lazy(0)), (0, 1, (), {}))
+        lazy = wraps(self.agen, self.agen, lazy=True)
+        self.assertTrue(inspect.isasyncgenfunction(lazy))
+        self.assertEqual(run(collect(lazy(2))), [0, 1])
+        self.assertEqual(run(collect(lazy(3))), [0, 1, 2])
+
+    def test_value(self):
+        """Values are returned by a coroutine without awaiting them."""
+        x = object()
+        fake = wraps(self.real)(value(x))
+        self.assertTrue(inspect.iscoroutinefunction(fake))
+        self.assertIs(run(fake(0)), x)
+        def real(a):
+            pass
+        fake = wraps(real)(value(self.real))
+        self.assertFalse(inspect.iscoroutinefunction(fake))
+        self.assertIs(fake(0), self.real)
+
+    def test_ast(self):
+        decorator = ASTorator.from_function(self.real)
+        decorator._kinds = None
+        fake = decorator.decorate(self.real)
+        self.assertTrue(inspect.iscoroutinefunction(fake))
+        self.assertEqual(run(fake(0, 2)), (0, 2, (), {}))
+        fake = decorator.decorate(value(3))
+        self.assertTrue(inspect.iscoroutinefunction(fake))
+        self.assertEqual(run(fake(0)), 3)
+        decorator = ASTorator.from_function(self.agen)
+        decorator._kinds = None
+        fake = decorator.decorate(self.agen)
+        self.assertTrue(inspect.isasyncgenfunction(fake))
+        self.assertEqual(run(collect(fake(2))), [0, 1])
+
+    def test_fusion(self):
+        inner = wraps(self.real)(self.real)
+        fake = wraps(inner)(inner)
+        self.assertTrue(inspect.iscoroutinefunction(fake))
+        self.assertEqual(run(fake(0)), (0, 1, (), {}))
+
+    def test_stats(self):
+        stats.enable()
+        try:
+            fake = wraps(self.real)(self.real)
+            gen = wraps(self.agen)(self.agen)
+        finally:
+            stats.disable()
+        self.assertEqual(run(fake(0)), (0, 1, (), {}))
+        self.assertEqual(run(collect(gen(2))), [0, 1])
+        self.assertEqual(stats.get(fake).calls, 1)
+        self.assertEqual(stats.get(gen).calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,14 +3,21 @@
 Python2 compatible unit tests for black_magic.decorator
 """
 
+import sys
+import types
 import unittest
 import functools
 from test._common import hd, _TestUtil
 
-from black_magic.decorator import wraps, partial
+from black_magic.compat import cell_contents_writable, code_replace
+from black_magic.batch import batch_call
+from black_magic.decorator import (ASTorator, wraps, partial, flatorator,
+                                   decorator, value, _forward_target)
 
 __all__ = [
     'TestASTorator',
+    'TestFlatorator',
+    'TestFusion',
 ]
 
 
@@ -192,6 +199,108 @@ class TestASTorator(unittest.TestCase, _TestUtil):
         self.assertRaises(TypeError, w2, 2, b=2)
         self.assertRaises(TypeError, w2, 0, 2, d=3)
 
+    def test_filename(self):
+        """The filename is taken from the code without file access."""
+        def real(a):
+            return a
+        decorator = ASTorator.from_function(real)
+        self.assertEqual(decorator.filename, real.__code__.co_filename)
+        self.assertFalse(hasattr(decorator, '_sourcefile'))
+        self.assertEqual(decorator.sourcefile,
+                         __file__.replace('.pyc', '.py'))
+        decorator = ASTorator.from_function(functools.partial(real))
+        self.assertEqual(decorator.filename, None)
+        self.assertEqual(decorator.sourcefile, None)
+
+
+class TestFlatorator(unittest.TestCase, _TestUtil):
+
+    def test_direct_call(self):
+        """The wrapper calls the flat decorator without intermediate frame."""
+        callers = []
+        def flat(fn, *args, **kwargs):
+            callers.append(sys._getframe(1).f_code)
+            return fn(*args, **kwargs)
+        def real(a, b=1):
+            return (a, b)
+        fake = flatorator(flat)(real)
+        self.assertEqual(fake(0), (0, 1))
+        self.assertIs(callers[0], fake.__code__)
+        self.assertEqual(fake.__code__.co_names, ())
+        self.assertIn('_call', fake.__code__.co_freevars)
+
+    def test_all_argument_kinds(self):
+        def times_two(fn, *args, **kwargs):
+            return 2 * fn(*args, **kwargs)
+        def real(a, b=1, *args, **kwargs):
+            return hash((a,b,args,hd(kwargs)))
+        fake = flatorator(times_two)(real)
+        self.assertEqual(fake(0, 1, 2, c=3), 2 * real(0, 1, 2, c=3))
+        self.assertEqual(fake(a=0), 2 * real(0))
+        self.assertRaises(TypeError, fake)
+        self.assertRaises(TypeError, fake, b=1)
+
+
+class TestFusion(unittest.TestCase):
+
+    """Wrappers of wrappers with the same parameters call through."""
+
+    def test_wraps(self):
+        callers = []
+        def real(a, b=1, *args, **kwargs):
+            callers.append(sys._getframe(1).f_code)
+            return (a, b, args, kwargs)
+        inner = wraps(real)(real)
+        outer = wraps(inner)(inner)
+        self.assertEqual(outer(0, c=2), (0, 1, (), {'c': 2}))
+        self.assertIs(callers[-1], outer.__code__)
+        lazy = wraps(inner, inner, lazy=True)
+        self.assertEqual(lazy(0, 2, 3), (0, 2, (3,), {}))
+        self.assertEqual(lazy(0, 2, 3), (0, 2, (3,), {}))
+        if cell_contents_writable:
+            self.assertIs(callers[-1], lazy.__code__)
+
+    def test_mutable_value(self):
+        """Wrappers of values that can not be code constants."""
+        def real(a, b=1):
+            pass
+        for x in ([], {'stub': True}):
+            inner = wraps(real)(value(x))
+            self.assertIs(wraps(real)(inner)(0), x)
+            self.assertIs(wraps(real, inner, lazy=True)(0), x)
+            fake = decorator(lambda fn: wraps(fn)(value(x)))(real)
+            self.assertIs(fake(0), x)
+            self.assertEqual(batch_call(inner, [1, 2]), [x, x])
+        # code objects with unhashable constants are never fused:
+        code = code_replace(real.__code__,
+                            co_consts=real.__code__.co_consts + ([],))
+        self.assertIsNone(_forward_target(types.FunctionType(code, {})))
+
+    def test_flatorator(self):
+        """The flat decorator is called with the original function."""
+        def flat(fn, *args, **kwargs):
+            return (fn, sys._getframe(1).f_code) + fn(*args, **kwargs)
+        def real(a, b=1):
+            return (a, b)
+        inner = flatorator(flat)(real)
+        outer = wraps(inner)(inner)
+        self.assertEqual(outer(0), (real, outer.__code__, 0, 1))
+
+    def test_different_parameters(self):
+        """Wrappers with other parameters or defaults are not fused."""
+        def real(a, b=1):
+            return (a, b)
+        def other(x, b=1):
+            return (x, b)
+        inner = wraps(real)(real)
+        self.assertEqual(wraps(other)(inner)(0), (0, 1))
+        with_defaults = wraps(real)(inner)
+        with_defaults.__defaults__ = (2,)
+        self.assertEqual(with_defaults(0), (0, 2))
+        inner.__defaults__ = (3,)
+        self.assertEqual(wraps(real)(inner)(0), (0, 1))
+        self.assertEqual(inner(0), (0, 3))
+
 
 if __name__ == '__main__':
     unittest.main()
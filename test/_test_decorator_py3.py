@@ -6,8 +6,12 @@ Python3 unit tests for black_magic.decorator
 import unittest
 from test._common import _TestUtil, hd
 
+from black_magic.compat import signature
+from black_magic.decorator import ASTorator
+
 __all__ = [
     'TestASToratorPy3',
+    'TestBoundArguments',
 ]
 
 
@@ -68,5 +72,65 @@ class TestASToratorPy3(unittest.TestCase, _TestUtil):
         self.must_fail(0, 4, b=1)
 
 
+class TestBoundArguments(unittest.TestCase):
+
+    """Tests for ASTorator.decorate_with_boundargs(pec)."""
+
+    def real(self, a, b=1, *args, c, d=2, **kwargs):
+        pass
+
+    calls = [
+        ((0,), {'c': 3}),
+        ((0, 1, 2, 3), {'c': 3, 'e': 4}),
+        ((), {'a': 0, 'c': 3, 'd': 4}),
+    ]
+
+    def check(self, decorator):
+        sig = signature(self.real)
+        bound = decorator.decorate_with_boundargs(lambda ba: ba)
+        argspec = decorator.decorate_with_boundargspec(lambda spec: spec)
+        for args, kwargs in self.calls:
+            expected = sig.bind(*args, **kwargs)
+            expected.apply_defaults()
+            ba = bound(*args, **kwargs)
+            self.assertEqual(ba.arguments, dict(expected.arguments))
+            self.assertEqual(ba.args, expected.args)
+            self.assertEqual(ba.kwargs, expected.kwargs)
+            self.assertIs(ba.signature, decorator.signature)
+            self.assertEqual(argspec(*args, **kwargs), ba.argspec())
+        spec = argspec(0, 1, 2, c=3, e=4)
+        self.assertEqual(spec.args, (0, 1))
+        self.assertEqual(spec.varargs, (2,))
+        self.assertEqual(spec.kwonlyargs, {'c': 3, 'd': 2})
+        self.assertEqual(spec.varkw, {'e': 4})
+        self.assertRaises(TypeError, bound, 0)
+        self.assertRaises(TypeError, argspec, 0)
+
+    def test_template(self):
+        self.check(ASTorator.from_function(self.real))
+
+    def test_ast(self):
+        decorator = ASTorator.from_function(self.real)
+        decorator._kinds = None
+        self.check(decorator)
+
+    def test_signature(self):
+        decorator = ASTorator.from_function(self.real)
+        for method in (decorator.decorate_with_boundargs,
+                       decorator.decorate_with_boundargspec):
+            fake = method(lambda ba: ba)
+            self.assertEqual(signature(fake), signature(self.real))
+
+    def test_wide_signature(self):
+        names = ['a%d' % i for i in range(40)]
+        namespace = {}
+        exec('def real(%s): pass' % ', '.join(names), namespace)
+        decorator = ASTorator.from_function(namespace['real'])
+        bound = decorator.decorate_with_boundargs(lambda ba: ba)
+        ba = bound(*range(40))
+        self.assertEqual(list(ba.arguments), names)
+        self.assertEqual(ba.args, tuple(range(40)))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,4 @@
+import sys
+from test.benchmark import suite
+
+sys.exit(suite.main())
@@ -0,0 +1,104 @@
+"""
+Import time benchmark for black_magic.decorator.
+
+Imports the module in fresh interpreters with ``-X importtime`` and reports
+the cumulative import time together with the modules that take the most
+time. Fails if the median exceeds the budget or if one of the modules that
+should only be imported on demand is loaded.
+
+Run as::
+
+    python -m test.benchmark.importtime [--repeat N] [--budget MS]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+
+MODULE = 'black_magic.decorator'
+
+#: Budget for the cumulative import time in milliseconds.
+BUDGET = 5.0
+
+#: Modules that must not be imported by ``import black_magic.decorator``.
+LAZY_MODULES = ('ast', 'inspect', 're', 'threading', 'collections',
+                'functools', 'tokenize', 'dis')
+
+
+def import_time(code, env=None):
+    """Run ``code`` in a new interpreter, return {module: (self, cum)}."""
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stderr=subprocess.STDOUT, env=env, universal_newlines=True)
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def measure(repeat=20, module=MODULE):
+    """
+    Return statistics for the import of ``module`` in milliseconds.
+
+    Byte code is cached in a temporary directory, so that the numbers do
+    not depend on the ``__pycache__`` of the environment.
+    """
+    cache = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        code = 'import ' + module
+        import_time(code, env)          # warm up the byte code cache
+        startup = import_time('pass', env)
+        runs = [import_time(code, env) for _ in range(repeat)]
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+    totals = sorted(run[module][1] / 1000.0 for run in runs)
+    modules = dict((name, t) for name, t in runs[-1].items()
+                   if name not in startup)
+    return {
+        'min': totals[0],
+        'median': totals[len(totals) // 2],
+        'max': totals[-1],
+        'modules': sorted(modules),
+        'slowest': sorted(((t[0] / 1000.0, name)
+                           for name, t in modules.items()), reverse=True)[:5],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='number of fresh interpreters')
+    parser.add_argument('--budget', type=float, default=BUDGET,
+                        help='maximum median import time in ms')
+    opts = parser.parse_args(argv)
+
+    result = measure(opts.repeat)
+    print('import %s: median %.2f ms (min %.2f, max %.2f, budget %.2f)' % (
+        MODULE, result['median'], result['min'], result['max'], opts.budget))
+    for self_ms, name in result['slowest']:
+        print('  %7.2f ms  %s' % (self_ms, name))
+
+    status = 0
+    eager = [name for name in LAZY_MODULES if name in result['modules']]
+    if eager:
+        print('modules that should be imported lazily: ' + ', '.join(eager))
+        status = 1
+    if result['median'] > opts.budget:
+        print('import time exceeds the budget')
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Memory benchmark for black_magic.decorator.
+
+Creates large numbers of wrappers with each tool and reports the memory
+retained per wrapper as traced by ``tracemalloc``, as well as the memory
+allocated by a single call of a wrapper and of ``_ParameterBinding.bind``.
+The ``functools`` counterparts are measured for comparison. Fails if a
+wrapper exceeds the budget or if calls retain memory.
+
+Run as::
+
+    python -m test.benchmark.memory [--max-count N] [--shape NAME]
+"""
+
+from __future__ import print_function
+
+import gc
+import sys
+import argparse
+import tracemalloc
+
+from black_magic.compat import signature
+from black_magic.decorator import _ParameterBinding
+from test.benchmark.suite import SHAPES, TOOLS, make_function
+
+
+#: Budget for the memory retained by a single wrapper in bytes.
+BUDGET = 1024
+
+
+def wrapper_memory(factory, func, count):
+    """
+    Create ``count`` wrappers and return the retained bytes per wrapper.
+
+    Also returns the peak memory per wrapper during creation, which
+    includes temporary allocations.
+    """
+    factory(func)           # warm up the code caches
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        wrappers = [factory(func) for _ in range(count)]
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del wrappers
+    return {
+        'count': count,
+        'retained': (after - before) / float(count),
+        'peak': (peak - before) / float(count),
+    }
+
+
+def call_memory(fn, number=1000):
+    """
+    Return the bytes allocated by a single call of ``fn``.
+
+    ``temporary`` is the peak memory during one call, ``retained`` the
+    memory that is still in use after ``number`` calls, per call.
+    """
+    fn()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        temporary = tracemalloc.get_traced_memory()[1] - before
+        for _ in range(number):
+            fn()
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return {
+        'temporary': temporary,
+        'retained': retained / float(number + 1),
+    }
+
+
+def run(max_count=10**5, shape='p4', out=sys.stdout):
+    """Run the benchmark for ``10**4, ..., max_count`` wrappers per tool."""
+    name, params, args, kwargs = next(s for s in SHAPES if s[0] == shape)
+    func = make_function(params)
+    results = []
+
+    count = 10**4
+    while count <= max_count:
+        for tool, factory, reference in TOOLS:
+            wrapper = factory(func)
+            result = {
+                'tool': tool,
+                'shape': shape,
+                'reference': reference,
+                'create': wrapper_memory(factory, func, count),
+                'call': call_memory(lambda: wrapper(*args, **kwargs)),
+            }
+            results.append(result)
+            print('%-20s %8d wrappers %7.0f B/wrapper (peak %7.0f B)   '
+                  'call %5d B' % (
+                      '%s/%s' % (tool, shape), count,
+                      result['create']['retained'],
+                      result['create']['peak'],
+                      result['call']['temporary']), file=out)
+        count *= 10
+
+    binding = _ParameterBinding.from_signature(signature(func))
+    bind = call_memory(lambda: binding.bind(*args, **kwargs))
+    print('%-20s %17s %7.0f B/call' % (
+        '_ParameterBinding.bind/%s' % shape, '', bind['temporary']),
+        file=out)
+    results.append({'tool': '_ParameterBinding.bind', 'shape': shape,
+                    'reference': None, 'call': bind})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--max-count', type=int, default=10**5,
+                        help='maximum number of wrappers per tool (10**6 '
+                        'needs several GB of memory)')
+    parser.add_argument('--shape', default='p4',
+                        choices=[s[0] for s in SHAPES],
+                        help='signature shape of the wrapped function')
+    parser.add_argument('--budget', type=int, default=BUDGET,
+                        help='maximum bytes retained per wrapper')
+    opts = parser.parse_args(argv)
+
+    results = run(opts.max_count, opts.shape)
+    status = 0
+    for result in results:
+        if result['tool'].startswith('functools'):
+            continue
+        if result.get('create', {}).get('retained', 0) > opts.budget:
+            print('%s exceeds the memory budget' % result['tool'])
+            status = 1
+        if result['call']['retained'] >= 1:
+            print('%s retains memory on every call' % result['tool'])
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
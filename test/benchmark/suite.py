@@ -0,0 +1,204 @@
+"""
+Benchmark suite for black_magic.decorator.
+
+Measures decoration time, call overhead and memory per wrapper for the
+black_magic decorator utilities and their ``functools`` counterparts over
+a matrix of signature shapes, and the import time of the module (see
+:mod:`test.benchmark.importtime`).
+
+Run as::
+
+    python -m test.benchmark [--quick] [--json FILE] [--filter SUBSTRING]
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import platform
+import argparse
+import functools
+import tracemalloc
+from timeit import default_timer
+
+import black_magic
+import black_magic.decorator
+from test.benchmark import importtime
+
+
+# name -> (parameter list, positional call args, keyword call args)
+SHAPES = [
+    ('p0', '', (), {}),
+    ('p1', 'a0', (0,), {}),
+    ('p4', 'a0, a1, a2, a3', (0, 1, 2, 3), {}),
+    ('p16', ', '.join('a%d' % i for i in range(16)), tuple(range(16)), {}),
+    ('p64', ', '.join('a%d' % i for i in range(64)), tuple(range(64)), {}),
+    ('defaults4', 'a0, a1=1, a2=2, a3=3', (0,), {}),
+    ('kwonly4', 'a0, *, k0, k1, k2=2, k3=3', (0,), {'k0': 0, 'k1': 1}),
+    ('varargs', 'a0, a1, *args, **kwargs', (0, 1, 2, 3), {'e': 5}),
+    ('annotations4', 'a0: int, a1: int, a2: str = "", a3: list = None',
+     (0, 1), {}),
+]
+
+# positional-only parameters require python 3.8:
+if sys.version_info >= (3, 8):
+    SHAPES.append(('posonly4', 'a0, a1, /, a2, a3=3', (0, 1, 2), {}))
+
+
+def make_function(params):
+    """Create a function with the given parameter list."""
+    namespace = {}
+    exec('def func(%s):\n    return 0' % params, namespace)
+    return namespace['func']
+
+
+def passthrough(*args, **kwargs):
+    return 0
+
+
+def flat(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def deco(fn):
+    def wrapper(*args, **kwargs):
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+# name -> (factory(func) -> wrapper, reference name)
+TOOLS = [
+    ('functools.wraps', lambda f: functools.wraps(f)(deco(f)), None),
+    ('wraps', lambda f: black_magic.decorator.wraps(f)(deco(f)),
+     'functools.wraps'),
+    ('decorator', black_magic.decorator.decorator(deco), 'functools.wraps'),
+    ('flatorator', black_magic.decorator.flatorator(flat), 'functools.wraps'),
+    ('functools.partial', lambda f: functools.partial(f), None),
+    ('partial', lambda f: black_magic.decorator.partial(f),
+     'functools.partial'),
+    ('metapartial', black_magic.decorator.metapartial(), 'functools.partial'),
+]
+
+
+def percentile(values, p):
+    """Return the p-th percentile of the sorted list ``values``."""
+    index = (len(values) - 1) * p / 100.0
+    lo = int(index)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (index - lo)
+
+
+def measure(fn, number, repeat, warmup):
+    """Time ``fn`` and return statistics per call in seconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = default_timer()
+        for _ in range(number):
+            fn()
+        samples.append((default_timer() - start) / number)
+    samples.sort()
+    return {
+        'min': samples[0],
+        'median': percentile(samples, 50),
+        'p90': percentile(samples, 90),
+        'p99': percentile(samples, 99),
+        'max': samples[-1],
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def measure_memory(factory, func, number):
+    """Return the average number of bytes retained per created wrapper."""
+    factory(func)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        wrappers = [factory(func) for _ in range(number)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del wrappers
+    return (after - before) / float(number)
+
+
+def run(quick=False, filter=None, out=sys.stdout):
+    """Run the complete benchmark matrix and return the results."""
+    if quick:
+        options = dict(repeat=5, warmup=1)
+        decorate_number, call_number, memory_number = 50, 500, 100
+    else:
+        options = dict(repeat=25, warmup=3)
+        decorate_number, call_number, memory_number = 200, 5000, 1000
+
+    results = []
+    for shape, params, args, kwargs in SHAPES:
+        func = make_function(params)
+        for tool, factory, reference in TOOLS:
+            name = '%s/%s' % (tool, shape)
+            if filter and filter not in name:
+                continue
+            wrapper = factory(func)
+            call = lambda: wrapper(*args, **kwargs)
+            result = {
+                'tool': tool,
+                'shape': shape,
+                'reference': reference,
+                'decorate': measure(lambda: factory(func),
+                                    decorate_number, **options),
+                'call': measure(call, call_number, **options),
+                'memory': measure_memory(factory, func, memory_number),
+            }
+            results.append(result)
+            print('%-32s decorate %9.2f us   call %7.3f us   %8.0f B' % (
+                name,
+                result['decorate']['median'] * 1e6,
+                result['call']['median'] * 1e6,
+                result['memory'],
+            ), file=out)
+
+    # relative cost compared to the functools equivalents:
+    index = dict(((r['tool'], r['shape']), r) for r in results)
+    for result in results:
+        ref = index.get((result['reference'], result['shape']))
+        if ref is not None:
+            result['ratio'] = {
+                'decorate': (result['decorate']['median'] /
+                             ref['decorate']['median']),
+                'call': result['call']['median'] / ref['call']['median'],
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer iterations, for smoke testing')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write machine readable results to FILE')
+    parser.add_argument('--filter', metavar='SUBSTRING',
+                        help='only run benchmarks matching tool/shape')
+    opts = parser.parse_args(argv)
+
+    results = run(quick=opts.quick, filter=opts.filter)
+    imports = importtime.measure(repeat=5 if opts.quick else 20)
+    print('%-32s median   %9.2f ms   budget %.2f ms' % (
+        'import', imports['median'], importtime.BUDGET))
+    if opts.json:
+        report = {
+            'black_magic': black_magic.__version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'results': results,
+            'import': imports,
+        }
+        with open(opts.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Stress benchmark for concurrent decoration.
+
+Decorates the same set of functions from several threads at once, starting
+with empty code caches, and reports the throughput and how often code for
+the same key was compiled more than once.
+
+Run as::
+
+    python -m test.benchmark.threads [--threads N] [--functions M]
+"""
+
+from __future__ import print_function
+
+import sys
+import ast
+import argparse
+import threading
+from collections import Counter
+from timeit import default_timer
+
+import black_magic.decorator
+from black_magic.decorator import ASTorator
+from test.benchmark.suite import SHAPES, TOOLS, make_function
+
+
+class CompileCounter(object):
+
+    """Count the compilations of templates and AST code by key."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        module = black_magic.decorator
+        self._compile_template = module._compile_template
+        self._compile = ASTorator._compile
+        def compile_template(kinds, body):
+            self._count(('template', kinds, body))
+            return self._compile_template(kinds, body)
+        def compile(astorator, call=None, mode=None):
+            self._count(('ast', astorator._shape,
+                         call if call is None else ast.dump(call), mode))
+            return self._compile(astorator, call, mode)
+        module._compile_template = compile_template
+        ASTorator._compile = compile
+        return self
+
+    def __exit__(self, *exc_info):
+        black_magic.decorator._compile_template = self._compile_template
+        ASTorator._compile = self._compile
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    @property
+    def compiles(self):
+        return sum(self.counts.values())
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.counts.values())
+
+
+def run(num_threads, num_functions, out=sys.stdout):
+    """Decorate ``num_functions`` per shape and tool from each thread."""
+    functions = [make_function(params)
+                 for _ in range(num_functions)
+                 for _, params, _, _ in SHAPES]
+    factories = [factory for name, factory, _ in TOOLS
+                 if not name.startswith('functools')]
+
+    ASTorator.template_cache.clear()
+    ASTorator.specialized_cache.clear()
+    ASTorator.code_cache.clear()
+
+    barrier = threading.Barrier(num_threads)
+    errors = []
+    def work():
+        barrier.wait()
+        try:
+            for func in functions:
+                for factory in factories:
+                    factory(func)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(num_threads)]
+    with CompileCounter() as counter:
+        start = default_timer()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = default_timer() - start
+
+    if errors:
+        raise errors[0]
+    decorations = num_threads * len(functions) * len(factories)
+    result = {
+        'threads': num_threads,
+        'decorations': decorations,
+        'seconds': elapsed,
+        'throughput': decorations / elapsed,
+        'compiles': counter.compiles,
+        'duplicates': counter.duplicates,
+    }
+    print('%2d threads: %8.0f decorations/s  %4d compiles  %d duplicates' % (
+        num_threads, result['throughput'],
+        result['compiles'], result['duplicates']), file=out)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--threads', type=int, default=8,
+                        help='maximum number of threads')
+    parser.add_argument('--functions', type=int, default=20,
+                        help='number of functions per signature shape')
+    opts = parser.parse_args(argv)
+
+    results = []
+    num_threads = 1
+    while num_threads <= opts.threads:
+        results.append(run(num_threads, opts.functions))
+        num_threads *= 2
+    return 1 if any(r['duplicates'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
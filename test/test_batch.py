@@ -0,0 +1,97 @@
+# encoding: utf-8
+"""
+Unit tests for the batch invocation of black_magic.batch
+"""
+
+import sys
+import unittest
+from test._common import _TestBase
+
+from black_magic.batch import batch_call, batch_iter
+from black_magic.decorator import wraps, partial, flatorator
+
+__all__ = [
+    'TestBatch',
+]
+
+
+class TestBatch(unittest.TestCase, _TestBase):
+
+    def test_columns(self):
+        def real(a, b, c=3, *args, **kwargs):
+            return (a, b, c, args, kwargs)
+        self.assertEqual(batch_call(real, [0, 1], b=iter('ab')),
+                         [(0, 'a', 3, (), {}), (1, 'b', 3, (), {})])
+        self.assertEqual(batch_call(real, [0], [1], [2], [3], d=[4]),
+                         [(0, 1, 2, (3,), {'d': 4})])
+        # the shortest column determines the number of rows:
+        self.assertEqual(batch_call(real, [0, 1, 2], [0, 1]),
+                         [(0, 0, 3, (), {}), (1, 1, 3, (), {})])
+        self.assertEqual(batch_call(real, [], []), [])
+
+    def test_default_identity(self):
+        x = []
+        def real(a, b=x):
+            return b
+        result = batch_call(real, a=[0, 1])
+        self.assertIs(result[0], x)
+        self.assertIs(result[1], x)
+
+    def test_stream(self):
+        calls = []
+        def real(a, b):
+            calls.append(a)
+            return a + b
+        results = batch_iter(real, [1, 2], b=[10, 20])
+        self.assertEqual(calls, [])
+        self.assertEqual(next(results), 11)
+        self.assertEqual(calls, [1])
+        self.assertEqual(list(results), [22])
+        self.assertEqual(list(batch_iter(real, [1, 2], [3, 4])), [4, 6])
+
+    def test_partial(self):
+        """The original function is called directly with the bound values."""
+        callers = []
+        def real(a, b, c=3, *args, **kwargs):
+            callers.append(sys._getframe(1).f_code)
+            return (a, b, c, args, kwargs)
+        x = []
+        wrap = partial(real, x, d=x)
+        result = batch_call(wrap, [0, 1], c=[2, 3])
+        self.assertEqual(result, [(x, 0, 2, (), {'d': x}),
+                                  (x, 1, 3, (), {'d': x})])
+        self.assertIs(result[0][0], x)
+        self.assertIs(result[1][4]['d'], x)
+        self.assertNotIn(wrap.__code__, callers)
+        self.assertRaises(TypeError, batch_call, wrap, [0], a=[1])
+
+    def test_wrappers(self):
+        """Generated wrappers are bypassed."""
+        def flat(fn, *args, **kwargs):
+            return ('flat',) + fn(*args, **kwargs)
+        def real(a, b=1):
+            return (a, b)
+        fake = flatorator(flat)(real)
+        self.assertEqual(batch_call(fake, [0], b=[2]), [('flat', 0, 2)])
+        fake = wraps(real)(real)
+        self.assertEqual(batch_call(fake, [0]), [(0, 1)])
+
+    def test_missing_column(self):
+        def real(a, b, **kwargs):
+            return (a, b)
+        self.assertRaises(TypeError, batch_call, real)
+        self.assertRaises(TypeError, batch_call, real, [0])
+        self.assertRaises(TypeError, batch_call, real, [0], [1], [2])
+        # keyword columns are bound first, as by partial:
+        self.assertEqual(batch_call(real, [0], a=[1]), [(1, 0)])
+
+    def test_map(self):
+        """Positional columns for all parameters are passed to map."""
+        def real(a, b):
+            return (a, b)
+        self.assertIsInstance(batch_iter(real, [0], [1]), map)
+        self.assertEqual(batch_call(real, [0], [1]), [(0, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+# encoding: utf-8
+"""
+Unit tests for the bulk decoration of black_magic.bulk
+"""
+
+import sys
+import types
+import unittest
+from test._common import _TestBase
+
+from black_magic.bulk import decorate_class, decorate_module
+from black_magic.compat import signature
+from black_magic.decorator import (ASTorator, decorator, flatorator, wraps,
+                                   _forward_target)
+
+__all__ = [
+    'TestBulk',
+]
+
+
+def _tag(fn, *args, **kwargs):
+    return ('tag', fn(*args, **kwargs))
+
+tag = flatorator(_tag)
+
+
+class TestBulk(unittest.TestCase, _TestBase):
+
+    def setUp(self):
+        ASTorator.specialized_cache.clear()
+
+    def test_class(self):
+        class Point(object):
+            def __init__(self, x=0):
+                self._x = x
+            def get(self, offset=0):
+                return self._x + offset
+            @staticmethod
+            def static(a, b=1):
+                return (a, b)
+            @classmethod
+            def klass(cls, a):
+                return (cls, a)
+            @property
+            def x(self):
+                return self._x
+            @x.setter
+            def x(self, value):
+                self._x = value
+            alias = get
+            data = 1
+        init = Point.__init__
+        self.assertIs(decorate_class(Point, tag, lambda name, func:
+                                     name != '__init__'), Point)
+        self.assertIs(Point.__init__, init)
+        self.assertIs(Point.alias, Point.get)
+        self.assertEqual(Point.data, 1)
+
+        point = Point(2)
+        self.assertEqual(point.get(), ('tag', 2))
+        self.assertEqual(point.get.__name__, 'get')
+        self.assertEqual(Point.static(0), ('tag', (0, 1)))
+        self.assertEqual(Point.klass(0), ('tag', (Point, 0)))
+        self.assertEqual(point.x, ('tag', 2))
+        point.x = 3
+        self.assertEqual(point._x, 3)
+        self.assertIsInstance(vars(Point)['static'], staticmethod)
+        self.assertIsInstance(vars(Point)['klass'], classmethod)
+
+    def test_module(self):
+        module = types.ModuleType('bulk_module')
+        exec("def foo(a, b=[]):\n"
+             "    return (a, b)\n"
+             "def bar(c, d=None):\n"
+             "    return (c, d)\n"
+             "def baz(a, b=1, *args, **kwargs):\n"
+             "    return a\n", vars(module))
+        module.imported = signature
+        default = module.foo.__defaults__[0]
+        real = {'foo': module.foo, 'baz': module.baz}
+        decorate_module(module, tag)
+        self.assertIs(module.imported, signature)
+        self.assertEqual(module.foo(0), ('tag', (0, [])))
+        self.assertIs(module.foo(0)[1][1], default)
+        self.assertEqual(module.bar(0, 1), ('tag', (0, 1)))
+        self.assertEqual(module.baz(0), ('tag', 0))
+        for name, func in real.items():
+            self.assertEqual(signature(getattr(module, name)),
+                             signature(func))
+
+    def test_shared_code(self):
+        """Wrappers of the same shape are generated only once."""
+        module = types.ModuleType('bulk_module')
+        exec("\n".join("def f%d(a, b=%d):\n    return a + b\n" % (i, i)
+                       for i in range(20)), vars(module))
+        decorate_module(module, tag)
+        self.assertEqual(len(ASTorator.specialized_cache), 1)
+        self.assertEqual(module.f7(1), ('tag', 8))
+        self.assertEqual(module.f7.__code__.co_name, 'f7')
+        self.assertIn('f7', module.f7.__code__.co_filename)
+        # relabelled wrappers can still be fused:
+        fake = wraps(module.f7)(module.f7)
+        self.assertIs(_forward_target(fake)[0], _tag)
+        self.assertEqual(fake(1), ('tag', 8))
+
+    def test_decorator(self):
+        @decorator
+        def counted(fn):
+            def wrapper(*args, **kwargs):
+                calls.append(fn.__name__)
+                return fn(*args, **kwargs)
+            return wrapper
+        calls = []
+        class Foo(object):
+            def foo(self, a):
+                return a
+            def bar(self, a):
+                return -a
+        decorate_class(Foo, counted)
+        self.assertEqual((Foo().foo(1), Foo().bar(1)), (1, -1))
+        self.assertEqual(calls, ['foo', 'bar'])
+
+    def test_other_decorator(self):
+        """Other callables are applied to each function."""
+        def deco(fn):
+            return lambda *args: ('deco', fn(*args))
+        class Foo(object):
+            def foo(self, a):
+                return a
+        decorate_class(Foo, deco)
+        self.assertEqual(Foo().foo(1), ('deco', 1))
+
+    def test_positional_only(self):
+        if sys.version_info < (3, 8):
+            self.skipTest("positional-only parameters require python 3.8")
+        module = types.ModuleType('bulk_module')
+        exec("def foo(a, /, b=1):\n"
+             "    return (a, b)\n", vars(module))
+        decorate_module(module, tag)
+        self.assertEqual(module.foo(0), ('tag', (0, 1)))
+        self.assertRaises(TypeError, module.foo, a=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+# encoding: utf-8
+"""
+Unit tests for the code cache of black_magic.decorator.ASTorator
+"""
+
+import gc
+import ast
+import time
+import marshal
+import unittest
+import functools
+import threading
+from test._common import _TestBase
+
+from black_magic.common import LRUCache, SignatureCache
+from black_magic.compat import signature
+from black_magic.decorator import ASTorator, wraps, value
+
+__all__ = [
+    'TestLRUCache',
+    'TestSignatureCache',
+    'TestTemplateCache',
+    'TestCodeCache',
+]
+
+
+class TestLRUCache(unittest.TestCase, _TestBase):
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 0
+        cache['b'] = 1
+        self.assertEqual(cache.get('a'), 0)
+        cache['c'] = 2
+        self.assertEqual(sorted(cache._data), ['a', 'c'])
+        self.assertIs(cache.get('b'), None)
+        self.assertEqual(cache.info(), (1, 1, 2, 2))
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache['a'] = 0
+        cache.get('a')
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, 1024, 0))
+
+    def test_get_or_create_concurrent(self):
+        """Concurrent requests for the same key create the value once."""
+        cache = LRUCache()
+        created = []
+        def create():
+            created.append(None)
+            time.sleep(0.05)
+            return object()
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get_or_create('a', create)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len(results), 8)
+        for result in results:
+            self.assertIs(result, results[0])
+
+    def test_get_or_create_failure(self):
+        """A failed creation leaves the key free for the next attempt."""
+        cache = LRUCache()
+        def fail():
+            raise ValueError()
+        self.assertRaises(ValueError, cache.get_or_create, 'a', fail)
+        self.assertEqual(cache.get_or_create('a', lambda: 1), 1)
+        self.assertEqual(cache._pending, {})
+
+
+class TestSignatureCache(unittest.TestCase, _TestBase):
+
+    def setUp(self):
+        self.cache = SignatureCache()
+
+    def check(self, func, hits, misses):
+        self.assertEqual(self.cache(func), signature(func))
+        self.assertEqual(self.cache.info()[:2], (hits, misses))
+
+    def test_hit(self):
+        def func(a, b=1):
+            pass
+        self.check(func, 0, 1)
+        self.check(func, 1, 1)
+        self.assertIs(self.cache(func), self.cache(func))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_invalidate(self):
+        def func(a, b=[], **kwargs):
+            pass
+        def other(c, b=[]):
+            pass
+        self.check(func, 0, 1)
+        func.__defaults__ = ([],)
+        self.check(func, 0, 2)
+        func.__annotations__['a'] = int
+        self.check(func, 0, 3)
+        func.__code__ = other.__code__
+        self.check(func, 0, 4)
+        func.__signature__ = signature(lambda x: x)
+        self.check(func, 0, 5)
+        del func.__signature__
+        self.check(func, 0, 6)
+        self.check(func, 1, 6)
+
+    def test_kwdefaults(self):
+        namespace = {}
+        exec('def func(*, a=[]):\n    pass', namespace)
+        func = namespace['func']
+        self.check(func, 0, 1)
+        func.__kwdefaults__['a'] = []
+        self.check(func, 0, 2)
+        self.assertIs(self.cache(func).parameters['a'].default,
+                      func.__kwdefaults__['a'])
+
+    def test_weak(self):
+        def func(a):
+            pass
+        self.cache(func)
+        del func
+        gc.collect()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_concurrent(self):
+        """Concurrent lookups keep consistent statistics."""
+        funcs = []
+        for i in range(20):
+            namespace = {}
+            exec('def f(a, b=%d):\n    pass' % i, namespace)
+            funcs.append(namespace['f'])
+        results = []
+        def lookup():
+            for _ in range(50):
+                for func in funcs:
+                    results.append(self.cache(func) == signature(func))
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 8 * 50 * 20)
+        hits, misses = self.cache.info()[:2]
+        self.assertEqual(hits + misses, 8 * 50 * 20)
+        self.assertEqual(len(self.cache), 20)
+
+    def test_not_cached(self):
+        def func(a, b):
+            pass
+        p = functools.partial(func, 1)
+        self.check(p, 0, 1)
+        self.check(p, 0, 2)
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestTemplateCache(unittest.TestCase, _TestBase):
+
+    def setUp(self):
+        ASTorator.template_cache.clear()
+        ASTorator.specialized_cache.clear()
+        ASTorator.code_cache.clear()
+
+    def test_same_kinds(self):
+        """Functions with the same parameter kinds share a template."""
+        def foo(a, b=[]):
+            return (a, b)
+        def bar(c, d=()):
+            return (c, d)
+        fake_foo = wraps(foo)(foo)
+        fake_bar = wraps(bar)(bar)
+        self.assertEqual(ASTorator.template_cache.info()[:2], (1, 1))
+        self.assertIs(fake_foo(0)[1], foo.__defaults__[0])
+        self.assertIs(fake_bar(0)[1], bar.__defaults__[0])
+        self.assertEqual(fake_bar(d=1, c=0), (0, 1))
+        self.assertEqual(fake_foo.__name__, 'foo')
+        self.assertEqual(fake_bar.__name__, 'bar')
+        self.assertEqual(fake_bar.__code__.co_name, 'bar')
+        self.assertEqual(fake_bar.__code__.co_varnames, ('c', 'd'))
+
+    def test_specialized(self):
+        """Copies of templates do not evict shape-keyed code."""
+        expr = ast.Name(id='a', ctx=ast.Load())
+        def foo(a):
+            return a
+        wraps(foo)(expr)
+        for i in range(5):
+            namespace = {}
+            exec("def f%d(a):\n    return a\n" % i, namespace)
+            func = namespace['f%d' % i]
+            self.assertEqual(wraps(func)(func)(i), i)
+        self.assertEqual(len(ASTorator.code_cache), 1)
+        self.assertEqual(ASTorator.template_cache.info()[:2], (4, 1))
+
+    def test_different_kinds(self):
+        def foo(a, b):
+            return (a, b)
+        def bar(a, *b):
+            return (a, b)
+        wraps(foo)(foo)
+        wraps(bar)(bar)
+        self.assertEqual(ASTorator.template_cache.info()[:2], (0, 2))
+
+    def test_value(self):
+        def foo(a, b=1, *args, **kwargs):
+            pass
+        x = []
+        fake = wraps(foo)(value(x))
+        self.assertIs(fake(0), x)
+        self.assertIs(fake(0, 1, 2, c=3), x)
+        self.assertRaises(TypeError, fake)
+
+    def test_value_const(self):
+        """Immutable values are embedded as constants of the code."""
+        def foo(a, b=1):
+            pass
+        for x in (None, True, 1.5, 'a', b'a', (1, ('a',)), frozenset([1])):
+            fake = wraps(foo)(value(x))
+            self.assertIs(fake(0), x)
+            self.assertEqual(fake.__code__.co_freevars, ())
+            self.assertEqual(fake.__code__.co_names, ())
+            marshal.dumps(fake.__code__)
+            # AST backend:
+            decorator = ASTorator.from_function(foo)
+            decorator._kinds = None
+            fake = decorator.decorate(value(x))
+            self.assertIs(fake(0), x)
+            self.assertEqual(fake.__code__.co_names, ())
+        lazy = wraps(foo, value(x), lazy=True)
+        self.assertIs(lazy(0), x)
+        self.assertIs(lazy(0), x)
+
+    def test_value_mutable(self):
+        """Other values are kept out of the constants of the code."""
+        def foo(a, b=1):
+            pass
+        for x in ([], {'a': 1}, (1, []), object()):
+            fake = wraps(foo)(value(x))
+            self.assertIs(fake(0), x)
+            self.assertNotIn(x, fake.__code__.co_consts)
+            hash(fake.__code__)
+            marshal.dumps(fake.__code__)
+            # AST backend:
+            decorator = ASTorator.from_function(foo)
+            decorator._kinds = None
+            fake = decorator.decorate(value(x))
+            self.assertIs(fake(0), x)
+            hash(fake.__code__)
+        lazy = wraps(foo, value(x), lazy=True)
+        self.assertIs(lazy(0), x)
+        self.assertIs(lazy(0), x)
+
+
+class TestCodeCache(unittest.TestCase, _TestBase):
+
+    def setUp(self):
+        ASTorator.code_cache.clear()
+
+    def test_same_shape(self):
+        """Functions with the same signature shape share compiled code."""
+        def foo(a, b=[]):
+            return (a, b)
+        def bar(a, b=()):
+            return (a, b)
+        expr = ast.Name(id='b', ctx=ast.Load())
+        fake_foo = wraps(foo)(expr)
+        fake_bar = wraps(bar)(expr)
+        self.assertEqual(ASTorator.code_cache.info()[:2], (1, 1))
+        self.assertIs(fake_foo(0), foo.__defaults__[0])
+        self.assertIs(fake_bar(0), bar.__defaults__[0])
+        self.assertEqual(fake_bar.__name__, 'bar')
+        self.assertEqual(fake_bar.__code__.co_name, 'bar')
+
+    def test_different_shape(self):
+        """Parameter names and kinds are part of the shape, defaults not."""
+        def foo(a, b):
+            return (a, b)
+        def bar(a, b=1):
+            return (a, b)
+        def baz(a, c=1):
+            return (a, c)
+        expr = ast.Name(id='a', ctx=ast.Load())
+        wraps(foo)(expr)
+        fake = wraps(bar)(expr)
+        wraps(baz)(expr)
+        self.assertEqual(ASTorator.code_cache.info()[:2], (1, 2))
+        self.assertEqual(fake(0), 0)
+        self.assertEqual(fake.__defaults__, (1,))
+
+    def test_shared_code(self):
+        """Wrappers of the same name and shape share code and globals."""
+        def real(a, b=1):
+            return (a, b)
+        def other(a, b=2):
+            return (b, a)
+        fake_real = wraps(real)(real)
+        fake_other = wraps(real)(other)
+        self.assertIs(fake_real.__code__, fake_other.__code__)
+        self.assertIs(fake_real.__globals__, fake_other.__globals__)
+        self.assertEqual(list(fake_real.__globals__), ['__builtins__'])
+        self.assertEqual(fake_real(0), (0, 1))
+        self.assertEqual(fake_other(0), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
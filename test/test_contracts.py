@@ -0,0 +1,117 @@
+# encoding: utf-8
+"""
+Unit tests for the annotation checks of black_magic.contracts
+"""
+
+import unittest
+from test._common import _TestBase
+
+from black_magic.compat import signature
+from black_magic.contracts import checked, set_mode, get_mode
+
+__all__ = [
+    'TestChecked',
+]
+
+
+def positive(value):
+    return value > 0
+
+
+class TestChecked(unittest.TestCase, _TestBase):
+
+    def tearDown(self):
+        set_mode('full', 10)
+
+    def test_arguments(self):
+        def real(a: int, b: (int, float) = 1, *args: str, c: positive = 1,
+                 **kwargs: int) -> tuple:
+            return (a, b, args, c, kwargs)
+        fake = checked(real)
+        self.assertEqual(signature(fake), signature(real))
+        self.assertEqual(fake(0, 1.5, 'x', c=2, d=3),
+                         (0, 1.5, ('x',), 2, {'d': 3}))
+        self.assertRaisesRegex(TypeError, "argument 'a' must be int, not str",
+                               fake, 'a')
+        self.assertRaisesRegex(TypeError, "'b' must be int or float",
+                               fake, 0, None)
+        self.assertRaisesRegex(TypeError, "argument 'args' item must be str",
+                               fake, 0, 1, 'x', 2)
+        self.assertRaisesRegex(TypeError, "'c' does not satisfy positive",
+                               fake, 0, c=0)
+        self.assertRaisesRegex(TypeError, "'kwargs' item must be int",
+                               fake, 0, d='x')
+
+    def test_return(self):
+        @checked
+        def real(a) -> int:
+            return a
+        self.assertEqual(real(1), 1)
+        self.assertRaisesRegex(TypeError, r"real\(\) return value must be int",
+                               real, 'a')
+        @checked
+        def real(a) -> None:
+            return a
+        self.assertIsNone(real(None))
+        self.assertRaises(TypeError, real, 0)
+
+    def test_unchecked(self):
+        """Functions without checkable annotations are not wrapped."""
+        def real(a, b: 'int' = 0):
+            return a
+        self.assertIs(checked(real), real)
+
+    def test_generic_alias(self):
+        """Generic aliases are neither classes nor predicates."""
+        try:
+            aliases = [eval(a) for a in ('list[int]', 'dict[str, int]',
+                                         'tuple[int, ...]')]
+        except TypeError:
+            self.skipTest("no generic aliases")
+        def real(xs, m=None, t=(), n=0):
+            return (xs, m, t, n)
+        real.__annotations__ = dict(zip(('xs', 'm', 't'), aliases))
+        self.assertIs(checked(real), real)
+        real.__annotations__['n'] = int
+        fake = checked(real)
+        self.assertEqual(fake([]), ([], None, (), 0))
+        self.assertEqual(fake(5, t=1), (5, None, 1, 0))
+        self.assertRaises(TypeError, fake, [], n='a')
+
+    def test_parameter_names(self):
+        """Parameters can have the names used by the generated code."""
+        @checked
+        def real(_call: int, _bm_result: int = 0) -> int:
+            return _call + _bm_result
+        self.assertEqual(real(1, 2), 3)
+        self.assertRaises(TypeError, real, 1, 'a')
+
+    def test_modes(self):
+        calls = []
+        def check(value):
+            calls.append(value)
+            return True
+        @checked
+        def real(a: check):
+            return a
+        set_mode('sampled', 3)
+        self.assertEqual(get_mode(), 'sampled')
+        for i in range(7):
+            real(i)
+        self.assertEqual(calls, [0, 3, 6])
+        set_mode('off')
+        real(7)
+        self.assertEqual(calls, [0, 3, 6])
+        set_mode('full')
+        real(8)
+        self.assertEqual(calls, [0, 3, 6, 8])
+        self.assertRaises(ValueError, set_mode, 'partial')
+
+    def test_coroutine(self):
+        async def real(a: int):
+            return a
+        self.assertRaises(TypeError, checked, real)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,10 +3,16 @@ Tests that are syntactically impossible on python2.
 """
 
 import unittest
-from test._test_decorator_py2 import TestASTorator
+from test._test_decorator_py2 import (
+    TestASTorator, TestFlatorator, TestFusion)
 
 try:
-    from test._test_decorator_py3 import TestASToratorPy3
+    from test._test_decorator_py3 import TestASToratorPy3, TestBoundArguments
+except SyntaxError:
+    pass
+
+try:
+    from test._test_async import TestAsync
 except SyntaxError:
     pass
 
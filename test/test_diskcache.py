@@ -0,0 +1,73 @@
+# encoding: utf-8
+"""
+Unit tests for black_magic.diskcache
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from test._common import _TestBase
+
+from black_magic import diskcache
+from black_magic.decorator import ASTorator, wraps
+
+__all__ = [
+    'TestDiskCache',
+]
+
+
+class TestDiskCache(unittest.TestCase, _TestBase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = diskcache.enable(self.path)
+        ASTorator.template_cache.clear()
+        ASTorator.specialized_cache.clear()
+        ASTorator.code_cache.clear()
+
+    def tearDown(self):
+        diskcache.disable()
+        shutil.rmtree(self.path)
+
+    def files(self):
+        return [name for name in os.listdir(self.path)
+                if name.endswith(self.cache.suffix)]
+
+    def test_persist(self):
+        def real(a, b=1, *args, **kwargs):
+            return (a, b, args, kwargs)
+        wraps(real)(real)
+        self.assertEqual(len(self.files()), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        ASTorator.template_cache.clear()
+        ASTorator.specialized_cache.clear()
+        ASTorator.code_cache.clear()
+        fake = wraps(real)(real)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(fake(0, c=2), (0, 1, (), {'c': 2}))
+
+    def test_corrupt(self):
+        def real(a):
+            return a
+        wraps(real)(real)
+        name, = self.files()
+        with open(os.path.join(self.path, name), 'wb') as f:
+            f.write(b'garbage')
+        ASTorator.template_cache.clear()
+        ASTorator.specialized_cache.clear()
+        ASTorator.code_cache.clear()
+        self.assertEqual(wraps(real)(real)(0), 0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_eviction(self):
+        self.cache.maxsize = 1
+        def real(a):
+            return a
+        wraps(real)(real)
+        self.assertEqual(self.files(), [])
+        self.assertEqual(self.cache.size(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
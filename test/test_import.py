@@ -0,0 +1,47 @@
+# encoding: utf-8
+"""
+Unit tests for the lazy imports of black_magic.decorator
+"""
+
+import sys
+import unittest
+import subprocess
+
+__all__ = [
+    'TestImport',
+]
+
+
+def modules_after(code):
+    """Return the modules imported by ``code`` in a fresh interpreter."""
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys; before = set(sys.modules); ' + code + '; '
+        'print(" ".join(sorted(set(sys.modules) - before)))',
+    ], universal_newlines=True)
+    return set(output.split())
+
+
+class TestImport(unittest.TestCase):
+
+    def test_lazy_modules(self):
+        """Heavy modules are not imported with black_magic.decorator."""
+        if sys.version_info < (3, 7):
+            self.skipTest("inspect is imported lazily since python 3.7")
+        modules = modules_after('import black_magic.decorator')
+        self.assertIn('black_magic.decorator', modules)
+        for name in ('ast', 'inspect', 're', 'threading', 'collections',
+                     'functools', 'black_magic.stats'):
+            self.assertNotIn(name, modules)
+
+    def test_decorate_after_import(self):
+        """The lazily imported modules are loaded when needed."""
+        modules = modules_after(
+            'from black_magic.decorator import wraps; '
+            'f = wraps(lambda a, b=1: a)(lambda a, b=1: a); '
+            'assert f(2) == 2')
+        self.assertIn('inspect', modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
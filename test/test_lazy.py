@@ -0,0 +1,113 @@
+# encoding: utf-8
+"""
+Unit tests for lazy wrappers created by black_magic.decorator
+"""
+
+import sys
+import unittest
+from test._common import _TestBase
+
+from black_magic.compat import signature, cell_contents_writable
+from black_magic.decorator import (ASTorator, wraps, decorator, flatorator,
+                                   partial, _code_decorator)
+
+__all__ = [
+    'TestLazy',
+]
+
+
+class TestLazy(unittest.TestCase, _TestBase):
+
+    def test_stub(self):
+        """The stub looks like the wrapper before it is called."""
+        def real(a, b=1, *args, **kwargs):
+            """Docstring."""
+            return (a, b, args, kwargs)
+        real.attr = 'attr'
+        fake = wraps(real, real, lazy=True)
+        code = fake.__code__
+        self.assertEqual(signature(fake), signature(real))
+        self.assertEqual(fake.__name__, 'real')
+        self.assertEqual(fake.__doc__, 'Docstring.')
+        self.assertEqual(fake.attr, 'attr')
+        self.assertEqual(fake(0, c=2), (0, 1, (), {'c': 2}))
+        # older pythons keep forwarding from the stub:
+        if cell_contents_writable:
+            self.assertIsNot(fake.__code__, code)
+            self.assertIs(fake.__defaults__[0], real.__defaults__[0])
+        self.assertEqual(fake(0, 2, 3), (0, 2, (3,), {}))
+        self.assertRaises(TypeError, fake)
+        self.assertRaises(TypeError, fake, b=1)
+
+    def test_decorator(self):
+        def plus_one(fn):
+            def fake(*args, **kwargs):
+                return 1 + fn(*args, **kwargs)
+            return fake
+        def mul(a, b):
+            return a * b
+        fake = decorator(plus_one, lazy=True)(mul)
+        self.assertEqual(signature(fake), signature(mul))
+        self.assertEqual(fake(2, 3), 7)
+        self.assertRaises(TypeError, fake, 2)
+
+    def test_flatorator(self):
+        def times_two(fn, *args, **kwargs):
+            return 2 * fn(*args, **kwargs)
+        def add(a, b=1):
+            return a + b
+        fake = flatorator(times_two, lazy=True)(add)
+        self.assertEqual(signature(fake), signature(add))
+        self.assertEqual(fake(1), 4)
+        self.assertEqual(fake(1, b=2), 6)
+
+    def test_no_signature(self):
+        """The signature is not computed before the first call."""
+        def real(a: int, b=[], *args, c, d=1, **kwargs) -> tuple:
+            return (a, b, args, c, d, kwargs)
+        info = ASTorator.signature_cache.info()
+        fake = wraps(real, real, lazy=True)
+        fake_flat = flatorator(lambda fn, *a, **kw: fn(*a, **kw),
+                               lazy=True)(real)
+        self.assertEqual(ASTorator.signature_cache.info(), info)
+        self.assertEqual(signature(fake), signature(real))
+        self.assertEqual(signature(fake_flat), signature(real))
+        self.assertEqual(fake.__annotations__, real.__annotations__)
+        self.assertEqual(fake(0, c=2), (0, [], (), 2, 1, {}))
+        self.assertIs(fake(0, c=2)[1], real.__defaults__[0])
+        self.assertEqual(fake_flat(0, 1, 2, c=3, e=4),
+                         (0, 1, (2,), 3, 1, {'e': 4}))
+        self.assertEqual(ASTorator.signature_cache.info(), info)
+        eager = ASTorator.from_function(real)
+        lazy = _code_decorator(real)
+        for attr in ('_kinds', '_call_layout', '_varnames', '_defaults',
+                     '_kwdefaults', '_annotations', '_filename'):
+            self.assertEqual(getattr(lazy, attr), getattr(eager, attr))
+        self.assertEqual(lazy.signature, eager.signature)
+
+    def test_positional_only(self):
+        """Positional-only parameters are read from the code object."""
+        if sys.version_info < (3, 8):
+            self.skipTest("positional-only parameters require python 3.8")
+        namespace = {}
+        exec("def real(a, /, b=1):\n"
+             "    return (a, b)\n", namespace)
+        real = namespace['real']
+        fake = wraps(real, real, lazy=True)
+        self.assertEqual(signature(fake), signature(real))
+        self.assertEqual(fake(0), (0, 1))
+        self.assertEqual(fake(0, b=2), (0, 2))
+        self.assertRaises(TypeError, fake, a=0)
+
+    def test_partial_of_stub(self):
+        """The signature of a stub does not leak into other wrappers."""
+        def real(a, b):
+            return (a, b)
+        fake = wraps(real, real, lazy=True)
+        wrap = partial(fake, b=1)
+        self.assertEqual(list(signature(wrap).parameters), ['a'])
+        self.assertEqual(wrap(0), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
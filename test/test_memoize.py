@@ -0,0 +1,150 @@
+# encoding: utf-8
+"""
+Unit tests for the memoization decorator of black_magic.memoize
+"""
+
+import unittest
+from test._common import _TestBase
+
+from black_magic.compat import signature
+from black_magic.memoize import memoize
+
+__all__ = [
+    'TestMemoize',
+]
+
+
+class TestMemoize(unittest.TestCase, _TestBase):
+
+    def setUp(self):
+        self.calls = []
+
+    def counted(self, func):
+        def wrapper(*args, **kwargs):
+            self.calls.append(args)
+            return func(*args, **kwargs)
+        return wrapper
+
+    def test_canonical_key(self):
+        calls = self.calls
+        def real(a, b=2, *args, **kwargs):
+            calls.append(a)
+            return (a, b, args, kwargs)
+        fake = memoize(real)
+        self.assertEqual(signature(fake), signature(real))
+        self.assertEqual(fake.__name__, 'real')
+        self.assertEqual(fake(1), (1, 2, (), {}))
+        self.assertEqual(fake(1, 2), (1, 2, (), {}))
+        self.assertEqual(fake(b=2, a=1), (1, 2, (), {}))
+        self.assertEqual(fake(1, 2, 3), (1, 2, (3,), {}))
+        self.assertEqual(fake(1, c=3, d=4), (1, 2, (), {'c': 3, 'd': 4}))
+        self.assertEqual(fake(1, d=4, c=3), (1, 2, (), {'c': 3, 'd': 4}))
+        self.assertEqual(calls, [1, 1, 1])
+        self.assertEqual(fake.cache_info(), (3, 3, 128, 3))
+        fake.cache_clear()
+        self.assertEqual(fake.cache_info(), (0, 0, 128, 0))
+        self.assertEqual(fake([]), ([], 2, (), {}))
+        self.assertEqual(fake(1, d=[]), (1, 2, (), {'d': []}))
+        self.assertEqual(fake.cache_info(), (0, 0, 128, 0))
+
+    def test_unhashable_default(self):
+        """Unhashable arguments and defaults are not cached."""
+        calls = self.calls
+        @memoize
+        def real(a, b=[]):
+            calls.append(a)
+            return a
+        self.assertEqual(real(1), 1)
+        self.assertEqual(real(1), 1)
+        self.assertEqual(real(1, 2), 1)
+        self.assertEqual(real(1, 2), 1)
+        self.assertEqual(calls, [1, 1, 1])
+
+    def test_parameter_names(self):
+        """Arguments named ``key`` or ``self`` are passed to the function."""
+        @memoize
+        def real(a, **kwargs):
+            return (a, kwargs)
+        self.assertEqual(real(1, key=2, self=3),
+                         (1, {'key': 2, 'self': 3}))
+        self.assertEqual(real(1, self=3, key=2),
+                         (1, {'key': 2, 'self': 3}))
+        self.assertEqual(real.cache_info().hits, 1)
+        namespace = {}
+        try:
+            exec("def real(a, *, key=1):\n    return (a, key)\n", namespace)
+        except SyntaxError:
+            self.skipTest("no keyword-only parameters")
+        real = memoize(namespace['real'])
+        self.assertEqual(real(1, key=2), (1, 2))
+        self.assertEqual(real(1), (1, 1))
+
+    def test_keyword_only(self):
+        namespace = {}
+        try:
+            exec("def real(a, *, b=1, c):\n    return (a, b, c)\n", namespace)
+        except SyntaxError:
+            self.skipTest("no keyword-only parameters")
+        real = namespace['real']
+        fake = memoize(real)
+        self.assertEqual(fake(0, c=2), (0, 1, 2))
+        self.assertEqual(fake(0, b=1, c=2), (0, 1, 2))
+        self.assertEqual(fake.cache_info().hits, 1)
+        self.assertEqual(signature(fake), signature(real))
+
+    def test_exclude(self):
+        @memoize(exclude=('verbose',))
+        def real(a, verbose=False):
+            return (a, verbose)
+        self.assertEqual(real(0, True), (0, True))
+        self.assertEqual(real(0), (0, True))
+        self.assertEqual(real(1), (1, False))
+        self.assertRaises(ValueError, memoize, real, exclude=('b',))
+
+    def test_lru(self):
+        fake = memoize(self.counted(lambda a: a), maxsize=2)
+        for a in (0, 1, 0, 2, 0, 1):
+            fake(a)
+        # 1 is evicted by 2 since 0 was used more recently:
+        self.assertEqual(self.calls, [(0,), (1,), (2,), (1,)])
+
+    def test_lfu(self):
+        fake = memoize(self.counted(lambda a: a), maxsize=2, policy='lfu')
+        for a in (0, 0, 1, 2, 1, 0):
+            fake(a)
+        # 1 and 2 are used less often than 0, the older one is evicted:
+        self.assertEqual(self.calls, [(0,), (1,), (2,), (1,)])
+        self.assertEqual(fake.cache_info(), (2, 4, 2, 2))
+        self.assertRaises(ValueError, memoize, lambda a: a, policy='mru')
+
+    def test_ttl(self):
+        now = [0]
+        fake = memoize(self.counted(lambda a: a), ttl=10,
+                       timer=lambda: now[0])
+        fake(0)
+        now[0] = 9
+        fake(0)
+        fake(1)
+        now[0] = 10
+        fake(0)
+        fake(1)
+        self.assertEqual(self.calls, [(0,), (1,), (0,)])
+
+    def test_maxbytes(self):
+        fake = memoize(self.counted(lambda a: a), maxsize=None,
+                       maxbytes=10, sizeof=lambda result: result)
+        for a in (3, 4, 3, 11, 5, 3):
+            fake(a)
+        # 11 does not fit at all, 5 evicts the least recently used 4:
+        self.assertEqual(self.calls, [(3,), (4,), (11,), (5,)])
+
+    def test_coroutine(self):
+        try:
+            exec("async def real(a):\n    return a\n", globals())
+        except SyntaxError:
+            self.skipTest("no coroutine functions")
+        self.assertRaises(TypeError, memoize, globals().pop('real'))
+
+
+if __name__ == '__main__':
+    unittest.main()
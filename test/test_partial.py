@@ -3,11 +3,13 @@
 Python2 compatible unit tests for black_magic.decorator.partial
 """
 
+import sys
 import unittest
 import functools
 from test._common import _TestBase
 
-from black_magic.decorator import wraps, partial
+from black_magic.compat import signature
+from black_magic.decorator import ASTorator, wraps, partial, metapartial
 
 __all__ = [
     'TestPartial',
@@ -88,6 +90,21 @@ class TestPartial(unittest.TestCase, _TestBase):
         self.assertRaises(TypeError, wrap)
         self.assertRaises(TypeError, wrap, 'd', 0)
 
+    def test_kw_only_canonical_names(self):
+        """Bound keyword-only parameters may have the template names."""
+        namespace = {}
+        try:
+            exec("def orig(a, *, _bm_0=1, b=2):\n"
+                 "    return (a, _bm_0, b)\n", namespace)
+        except SyntaxError:
+            self.skipTest("no keyword-only parameters")
+        orig = namespace['orig']
+        wrap = partial(orig, _bm_0=7)
+        self.assertEqual(wrap(1), (1, 7, 2))
+        self.assertEqual(wrap(1, b=3), (1, 7, 3))
+        wrap = partial(orig, b=7)
+        self.assertEqual(wrap(1, _bm_0=3), (1, 3, 7))
+
     def test_with_functools_partial(self):
         def orig(a, b, c, *args, **kwargs):
             return (a, b, c, args, kwargs)
@@ -100,6 +117,147 @@ class TestPartial(unittest.TestCase, _TestBase):
         self.assertRaises(TypeError, wrap, 'a', 'c', b='b')
         self.assertRaises(TypeError, wrap, 'a')
 
+    def test_functools_partial_args(self):
+        def orig(a, b, c):
+            return (a, b, c)
+        wrap = partial(functools.partial(orig, 'a'), 'b')
+        self.assertEqual(list(signature(wrap).parameters), ['c'])
+        self.assertEqual(wrap('c'), ('a', 'b', 'c'))
+
+    def test_nested_partial(self):
+        """Partials of partials call the original function directly."""
+        callers = []
+        def orig(a, b, c=3, *args, **kwargs):
+            callers.append(sys._getframe(1).f_code)
+            return (a, b, c, args, kwargs)
+        inner = partial(orig, b='b')
+        wrap = partial(partial(inner, 'a'), d='d')
+        self.assertEqual(list(signature(wrap).parameters),
+                         ['c', 'args', 'kwargs'])
+        self.assertEqual(wrap(), ('a', 'b', 3, (), {'d': 'd'}))
+        self.assertIs(callers[-1], wrap.__code__)
+        self.assertEqual(wrap('c', 0, e='e'),
+                         ('a', 'b', 'c', (0,), {'d': 'd', 'e': 'e'}))
+        self.assertRaises(TypeError, wrap, d='x')
+        self.assertEqual(inner('a'), ('a', 'b', 3, (), {}))
+        # bound positional parameters can not be passed by keyword:
+        self.assertRaises(TypeError, partial(partial(orig, 1, 2), a=5))
+        self.assertEqual(partial(partial(orig, 1), c=3)(2, 4),
+                         (1, 2, 3, (4,), {}))
+
+    def test_nested_partial_attributes(self):
+        def orig(a, b):
+            return (a, b)
+        inner = partial(orig, 'a')
+        inner.__doc__ = 'Docstring.'
+        wrap = partial(inner, 'b')
+        self.assertEqual(wrap.__doc__, 'Docstring.')
+        self.assertEqual(wrap(), ('a', 'b'))
+
+    def test_metapartial_same_shape(self):
+        """Partials of functions with the same shape share the binding."""
+        namespace = {}
+        exec('def foo(a, b, c=1, *args, **kwargs):\n'
+             '    return ("foo", a, b, c, args, kwargs)\n'
+             'def bar(a, b, c=2, *args, **kwargs):\n'
+             '    """Docstring."""\n'
+             '    return ("bar", a, b, c, args, kwargs)\n'
+             'def baz(a, b, c, *args, **kwargs):\n'
+             '    return ("baz", a, b, c, args, kwargs)\n', namespace)
+        foo, bar, baz = namespace['foo'], namespace['bar'], namespace['baz']
+        bar.attr = 'attr'
+        x = []
+        bind = metapartial(x, d=x)
+        partials = [bind(foo)]
+        misses = ASTorator.signature_cache.info().misses
+        partials += [bind(bar), bind(baz)]
+        # the signatures are not needed:
+        self.assertEqual(ASTorator.signature_cache.info().misses, misses)
+        for func, wrap in zip((foo, bar, baz), partials):
+            self.assertEqual(signature(wrap), signature(partial(func, x, d=x)))
+            self.assertEqual(wrap(0, 1), func(x, 0, 1, d=x))
+            self.assertEqual(wrap(0, 1, 2, e=3), func(x, 0, 1, 2, d=x, e=3))
+            self.assertIs(wrap(0, 1)[1], x)
+            self.assertEqual(wrap.__name__, func.__name__)
+        self.assertEqual(partials[0](0), ('foo', x, 0, 1, (), {'d': x}))
+        self.assertEqual(partials[1](0), ('bar', x, 0, 2, (), {'d': x}))
+        self.assertRaises(TypeError, partials[2], 0)
+        self.assertEqual(partials[1].__doc__, 'Docstring.')
+        self.assertEqual(partials[1].attr, 'attr')
+        self.assertEqual(partial(partials[1], 0)(), bar(x, 0, d=x))
+
+    def test_metapartial_annotations(self):
+        namespace = {}
+        exec('def foo(a, b: int = 1, *, c: str = "c") -> list:\n'
+             '    return [a, b, c]\n'
+             'def bar(a, b: float = 2, *, c: bytes = b"c"):\n'
+             '    return [a, b, c]\n', namespace)
+        foo, bar = namespace['foo'], namespace['bar']
+        bind = metapartial(0)
+        for func in (foo, bar, foo):
+            wrap = bind(func)
+            self.assertEqual(signature(wrap), signature(partial(func, 0)))
+            self.assertEqual(wrap(), func(0))
+
+    def test_positional_only(self):
+        """Partials with positional-only parameters use templates."""
+        if sys.version_info < (3, 8):
+            self.skipTest("positional-only parameters require python 3.8")
+        namespace = {}
+        exec('def orig(a, b, /, c=3, *args, d, **kwargs):\n'
+             '    return (a, b, c, args, d, kwargs)\n', namespace)
+        orig = namespace['orig']
+        wrap = partial(orig, 1, d=4)
+        self.assertEqual(str(signature(wrap)), '(b, /, c=3, *args, **kwargs)')
+        self.assertEqual(wrap(2), (1, 2, 3, (), 4, {}))
+        self.assertEqual(wrap(2, 5, 6, e=7), (1, 2, 5, (6,), 4, {'e': 7}))
+        self.assertEqual(wrap(2, b=0), (1, 2, 3, (), 4, {'b': 0}))
+        self.assertRaises(TypeError, wrap)
+        self.assertEqual(wrap.__code__.co_posonlyargcount, 1)
+        # the wrapper calls the function directly:
+        callers = []
+        namespace['callers'] = callers
+        namespace['sys'] = sys
+        exec('def orig(a, /, b):\n'
+             '    callers.append(sys._getframe(1).f_code)\n'
+             '    return (a, b)\n', namespace)
+        wrap = partial(namespace['orig'], b=2)
+        self.assertEqual(wrap(1), (1, 2))
+        self.assertIs(callers[-1], wrap.__code__)
+
+    def test_bound_value_identity(self):
+        def orig(a, b, *args, **kwargs):
+            return (a, b, args, kwargs)
+        x, y = [], {}
+        wrap = partial(orig, x, c=y)
+        self.assertIs(wrap(0)[0], x)
+        self.assertIs(wrap(0)[3]['c'], y)
+        self.assertIsNot(wrap(0)[3], wrap(0)[3])
+        self.assertEqual(wrap(0, 1, d=2), (x, 0, (1,), {'c': y, 'd': 2}))
+        self.assertRaises(TypeError, wrap, 0, c=1)
+
+    def test_bound_after_free(self):
+        def orig(a, b, c=3, *args):
+            return (a, b, c, args)
+        wrap = partial(orig, b='b')
+        self.assertEqual(wrap('a'), ('a', 'b', 3, ()))
+        self.assertEqual(wrap('a', 'c', 'd'), ('a', 'b', 'c', ('d',)))
+        self.assertEqual(wrap(c='c', a='a'), ('a', 'b', 'c', ()))
+        self.assertRaises(TypeError, wrap, 'a', b='b')
+
+    def test_wide_signature(self):
+        names = ['p%d' % i for i in range(64)]
+        namespace = {}
+        exec('def orig(%s): return (%s,)' % (', '.join(names),
+                                              ', '.join(names)), namespace)
+        orig = namespace['orig']
+        kwargs = dict((name, name) for name in names[::2])
+        wrap = partial(orig, *names[1:40:2], **kwargs)
+        self.assertEqual(signature(wrap).parameters.keys(),
+                         set(names[41::2]))
+        self.assertEqual(wrap(*names[41::2]), tuple(names))
+        self.assertRaises(TypeError, wrap, *names[41:])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,91 @@
+# encoding: utf-8
+"""
+Unit tests for the call statistics of black_magic.stats
+"""
+
+import time
+import unittest
+from test._common import _TestBase
+
+from black_magic import stats
+from black_magic.compat import signature
+from black_magic.decorator import wraps, flatorator, partial
+
+__all__ = [
+    'TestStats',
+]
+
+
+class TestStats(unittest.TestCase, _TestBase):
+
+    def setUp(self):
+        stats.enable()
+
+    def tearDown(self):
+        stats.disable()
+
+    def test_count(self):
+        def real(a, b=1, *args, **kwargs):
+            return (a, b, args, kwargs)
+        fakes = [
+            wraps(real)(real),
+            wraps(real, real, lazy=True),
+            flatorator(lambda fn, *args, **kwargs: fn(*args, **kwargs))(real),
+        ]
+        stats.disable()
+        for fake in fakes:
+            self.assertEqual(signature(fake), signature(real))
+            self.assertEqual(fake(0), (0, 1, (), {}))
+            self.assertEqual(fake(0, 2, 3, c=4), (0, 2, (3,), {'c': 4}))
+            result = stats.get(fake)
+            self.assertEqual(result.calls, 2)
+            self.assertEqual(sum(result.histogram), 2)
+            self.assertEqual(len(result.histogram), len(stats.BUCKETS) + 1)
+
+    def test_partial(self):
+        def real(a, b, _start=0):
+            return (a, b, _start)
+        fake = partial(real, 1)
+        self.assertEqual(fake(2, _start=3), (1, 2, 3))
+        self.assertEqual(stats.get(fake).calls, 1)
+
+    def test_histogram(self):
+        def real(delay):
+            time.sleep(delay)
+        fake = wraps(real)(real)
+        fake(0.002)
+        result = stats.get(fake)
+        self.assertGreaterEqual(result.time, 0.002)
+        # 1ms < t <= 4ms, unless the machine is very slow:
+        self.assertEqual(sum(result.histogram[6:]), 1)
+
+    def test_exception(self):
+        def real():
+            raise ValueError()
+        fake = wraps(real)(real)
+        self.assertRaises(ValueError, fake)
+        self.assertEqual(stats.get(fake).calls, 1)
+
+    def test_snapshot_reset(self):
+        def real():
+            pass
+        fake = wraps(real)(real)
+        fake()
+        self.assertEqual(stats.snapshot()[fake].calls, 1)
+        stats.reset()
+        self.assertEqual(stats.get(fake), (0, 0, (0,) * 12))
+        fake()
+        self.assertEqual(stats.get(fake).calls, 1)
+
+    def test_disabled(self):
+        stats.disable()
+        def real():
+            pass
+        fake = wraps(real)(real)
+        self.assertNotIn(fake, stats.snapshot())
+        self.assertEqual(fake.__code__.co_names, ())
+        self.assertEqual(fake.__code__.co_freevars, ('_call',))
+
+
+if __name__ == '__main__':
+    unittest.main()